@@ -0,0 +1,282 @@
+import bisect
+import gzip
+import io
+import tarfile
+import zipfile
+import zlib
+from pathlib import Path, PurePosixPath
+
+from shards import EntryStat
+
+# Archives whose ".json" members are queued without extracting them
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz')
+MEMBER_SUFFIX = ".json"
+# Individually compressed conversation files
+GZIP_SUFFIX = ".json.gz"
+
+# zlib window bits for a gzip header and trailer
+GZIP_WBITS = zlib.MAX_WBITS | 16
+READ_CHUNK = 64 * 1024
+# Decompressor state kept every this many bytes of a compressed tar; each copy
+# holds the 32 KiB window, so a 1 GB tarball needs about 5 MB of checkpoints
+CHECKPOINT_BYTES = 8 * 1024 * 1024
+
+
+def is_archive(path):
+    return Path(path).name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def is_gzip_file(path):
+    return Path(path).name.lower().endswith(GZIP_SUFFIX)
+
+
+def open_archive(path):
+    """
+    Opens a .zip, .tar, .tar.gz or .tgz file and indexes its conversation members.
+    """
+    if Path(path).name.lower().endswith('.zip'):
+        return ZipArchive(path)
+    return TarArchive(path)
+
+
+def _inflate(decompressor, chunk):
+    """
+    Returns (decompressor, output); concatenated gzip members get a fresh decompressor.
+    """
+    out = decompressor.decompress(chunk)
+    while decompressor.eof and decompressor.unused_data:
+        rest = decompressor.unused_data
+        decompressor = zlib.decompressobj(GZIP_WBITS)
+        out += decompressor.decompress(rest)
+    return decompressor, out
+
+
+class _CheckpointReader:
+    """
+    Read-only stream of a gzip file's contents that records checkpoints as it goes.
+
+    Every checkpoint is (output offset, input offset, copy of the decompressor),
+    taken at a chunk boundary, so decompression can later resume from there.
+    """
+
+    def __init__(self, fileobj, checkpoints, spacing):
+        self.fileobj = fileobj
+        self.checkpoints = checkpoints
+        self.spacing = spacing
+        self.decompressor = zlib.decompressobj(GZIP_WBITS)
+        self.buffer = b''
+        self.pos = 0
+        # Output offset of the end of the buffer
+        self.out_offset = 0
+        self.checkpoints.append((0, 0, self.decompressor.copy()))
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) - self.pos < size:
+            chunk = self.fileobj.read(READ_CHUNK)
+            if not chunk:
+                break
+            self.decompressor, out = _inflate(self.decompressor, chunk)
+            # Only the unread part is carried over, so headers read 512 bytes at a time stay cheap
+            self.buffer = self.buffer[self.pos:] + out
+            self.pos = 0
+            self.out_offset += len(out)
+            if self.out_offset - self.checkpoints[-1][0] >= self.spacing:
+                self.checkpoints.append((self.out_offset, self.fileobj.tell(), self.decompressor.copy()))
+        end = len(self.buffer) if size < 0 else self.pos + size
+        data = self.buffer[self.pos:end]
+        self.pos = end
+        return data
+
+
+class ZipArchive:
+    """
+    A .zip file opened for random access to its conversation members.
+
+    The zip central directory is the member index; reading a member
+    decompresses that member only.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.mtime_ns = self.path.stat().st_mtime_ns
+        self.zip = zipfile.ZipFile(self.path)
+        self.members = [
+            info for info in self.zip.infolist()
+            if not info.is_dir() and info.filename.endswith(MEMBER_SUFFIX)
+        ]
+
+    def __len__(self):
+        return len(self.members)
+
+    def member_name(self, index):
+        return self.members[index].filename
+
+    def member_size(self, index):
+        return self.members[index].file_size
+
+    def read_member(self, index):
+        return self.zip.read(self.members[index])
+
+    def open_member(self, index):
+        return self.zip.open(self.members[index])
+
+    def entries(self):
+        return [ArchiveEntry(self, index) for index in range(len(self))]
+
+    def close(self):
+        self.zip.close()
+
+
+class TarArchive:
+    """
+    A .tar, .tar.gz or .tgz file opened for random access to its conversation members.
+
+    The archive is read once, front to back, to index the offset and size of
+    every ".json" member. A compressed stream cannot be entered at an
+    arbitrary offset, so while indexing, a copy of the decompressor is kept
+    every checkpoint_bytes of output; reading a member then decompresses from
+    the nearest checkpoint before it instead of from the start of the archive.
+    """
+
+    def __init__(self, path, checkpoint_bytes=CHECKPOINT_BYTES):
+        self.path = Path(path)
+        self.mtime_ns = self.path.stat().st_mtime_ns
+        self.compressed = self.path.name.lower().endswith(('.gz', '.tgz'))
+        # (output offset, input offset, decompressor), in offset order
+        self.checkpoints = []
+        # (member name, data offset, size) in archive order
+        self.members = []
+        with open(self.path, 'rb') as f:
+            stream = _CheckpointReader(f, self.checkpoints, checkpoint_bytes) if self.compressed else f
+            with tarfile.open(fileobj=stream, mode='r|') as tar:
+                while True:
+                    info = tar.next()
+                    if info is None:
+                        break
+                    if info.isfile() and info.name.endswith(MEMBER_SUFFIX):
+                        self.members.append((info.name, info.offset_data, info.size))
+                    # Stream mode keeps every TarInfo; only the index above is needed
+                    tar.members = []
+        self.checkpoint_offsets = [checkpoint[0] for checkpoint in self.checkpoints]
+
+    def __len__(self):
+        return len(self.members)
+
+    def member_name(self, index):
+        return self.members[index][0]
+
+    def member_size(self, index):
+        return self.members[index][2]
+
+    def read_member(self, index):
+        _, offset, size = self.members[index]
+        # A handle per read, so prefetch workers do not share a file position
+        with open(self.path, 'rb') as f:
+            if not self.compressed:
+                f.seek(offset)
+                return f.read(size)
+            out_offset, in_offset, decompressor = self.checkpoints[bisect.bisect_right(self.checkpoint_offsets, offset) - 1]
+            decompressor = decompressor.copy()
+            f.seek(in_offset)
+            skip = offset - out_offset
+            parts = []
+            produced = 0
+            while produced < skip + size:
+                chunk = f.read(READ_CHUNK)
+                if not chunk:
+                    break
+                decompressor, out = _inflate(decompressor, chunk)
+                parts.append(out)
+                produced += len(out)
+        return b''.join(parts)[skip:skip + size]
+
+    def open_member(self, index):
+        return io.BytesIO(self.read_member(index))
+
+    def entries(self):
+        return [ArchiveEntry(self, index) for index in range(len(self))]
+
+    def close(self):
+        self.checkpoints = []
+
+
+class ArchiveEntry:
+    """
+    Path-like handle to one conversation member of an archive.
+
+    Provides the same parts of the pathlib.Path interface as ShardEntry. The
+    conversation_id (stem) is the stem of the member name, as for a file on
+    disk, so "export/abc123.json" is "abc123".
+    """
+
+    __slots__ = ('archive', 'index')
+
+    def __init__(self, archive, index):
+        self.archive = archive
+        self.index = index
+
+    @property
+    def stem(self):
+        return PurePosixPath(self.archive.member_name(self.index)).stem
+
+    @property
+    def name(self):
+        return f"{self.archive.path.name}:{self.archive.member_name(self.index)}"
+
+    def read_bytes(self):
+        return self.archive.read_member(self.index)
+
+    def open(self, mode='rb'):
+        return self.archive.open_member(self.index)
+
+    def stat(self):
+        return EntryStat(self.archive.member_size(self.index), self.archive.mtime_ns)
+
+    def __eq__(self, other):
+        return isinstance(other, ArchiveEntry) and other.archive is self.archive and other.index == self.index
+
+    def __hash__(self):
+        return hash((id(self.archive), self.index))
+
+    def __repr__(self):
+        return f"ArchiveEntry({str(self.archive.path)!r}, {self.index})"
+
+
+class GzipFileEntry:
+    """
+    Path-like handle to an individually gzipped conversation file ("<id>.json.gz").
+
+    The conversation_id (stem) is the file name without ".json.gz". stat()
+    reports the compressed file, like the corpus manifest does.
+    """
+
+    __slots__ = ('path',)
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    @property
+    def stem(self):
+        return self.path.name[:-len(GZIP_SUFFIX)]
+
+    @property
+    def name(self):
+        return self.path.name
+
+    def read_bytes(self):
+        return gzip.decompress(self.path.read_bytes())
+
+    def open(self, mode='rb'):
+        return gzip.open(self.path, 'rb')
+
+    def stat(self):
+        return self.path.stat()
+
+    def __eq__(self, other):
+        return isinstance(other, GzipFileEntry) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __repr__(self):
+        return f"GzipFileEntry({str(self.path)!r})"
@@ -0,0 +1,88 @@
+"""
+Generates synthetic conversation corpora shaped like example-conversations/*.json.
+
+Usage:
+    python benchmarks/generate_corpus.py OUT_DIR --files 10000 --messages 20 --message-length 120 --senders 2
+"""
+import argparse
+import json
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+
+WORDS = (
+    "hello thanks interested product price quote delivery order question help "
+    "available today tomorrow please could would great sure follow up details "
+    "call email booking schedule team support offer discount plan monthly"
+).split()
+
+
+def make_message(rng, length):
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:length].capitalize()
+
+
+def make_conversation(rng, messages, message_length, senders, start):
+    """
+    Returns one conversation dict; the first sender plays the lead.
+    """
+    names = ["Lead name"] + [f"Responder {idx}" for idx in range(1, max(senders, 1))]
+    timestamp = start
+    conversation_data = []
+    for idx in range(messages):
+        # Leads and responders alternate, with other responders chiming in at random
+        sender = names[0] if idx % 2 == 0 or len(names) == 1 else rng.choice(names[1:])
+        timestamp += timedelta(minutes=rng.randint(1, 240))
+        conversation_data.append({
+            "timestamp": timestamp.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "sender": sender,
+            "message": make_message(rng, max(1, int(rng.uniform(0.5, 1.5) * message_length))),
+            "is_automated": sender != names[0] and rng.random() < 0.1,
+        })
+    return {
+        "conversation_data": conversation_data,
+        "parsed_at": (timestamp + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "total_messages": messages,
+    }
+
+
+def generate_corpus(out_dir, files, messages=20, message_length=120, senders=2, seed=0):
+    """
+    Writes files conversation_NNNNNN.json into out_dir and returns their paths.
+
+    The output is deterministic for a given set of arguments.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    paths = []
+    for idx in range(files):
+        path = out_dir / f"conversation_{idx:06d}.json"
+        conversation = make_conversation(rng, messages, message_length, senders, start + timedelta(hours=idx))
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(conversation, f, indent=4)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic conversation corpus.")
+    parser.add_argument('out_dir')
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--messages', type=int, default=20, help="Messages per conversation")
+    parser.add_argument('--message-length', type=int, default=120, help="Mean characters per message")
+    parser.add_argument('--senders', type=int, default=2, help="Distinct senders per conversation")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate_corpus(args.out_dir, args.files, args.messages, args.message_length, args.senders, args.seed)
+    print(f"Wrote {args.files} conversations to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Times corpus discovery, parsing, rendering and saving on synthetic corpora.
+
+Usage:
+    python benchmarks/run_benchmarks.py --scales 1000,10000,100000 --output results.json
+    python benchmarks/run_benchmarks.py --scales 1000 --baseline results.json
+
+Results are written as JSON so runs of different versions can be diffed.
+Rendering uses a stub text widget, so no display (or Xvfb) is needed.
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from conversation_labeler import ConversationLabeler
+from conversation_view import ConversationView
+from corpus import CorpusScanner
+from generate_corpus import generate_corpus
+from label_schema import load_schema
+from label_store import LabelStore, LabelWriter
+import parsing
+
+# Palette used by the labeler, so tag setup costs the same
+AVAILABLE_COLORS = ['#ADD8E6', '#90EE90', '#FFA07A', '#FFD700', '#DDA0DD',
+                    '#FFB6C1', '#20B2AA', '#87CEFA', '#F08080', '#9370DB']
+SCHEMA = load_schema()
+SEGMENTS = [segment.name for segment in SCHEMA.segments]
+
+
+class StubText:
+    """
+    Stand-in for the conversation tk.Text widget that only counts what is inserted.
+    """
+
+    def __init__(self):
+        self.options = {'yscrollcommand': ''}
+        self.chars = 0
+
+    def insert(self, index, text, tags=None):
+        self.chars += len(text)
+
+    def delete(self, *args):
+        self.chars = 0
+
+    def configure(self, **options):
+        self.options.update(options)
+
+    def cget(self, key):
+        return self.options.get(key, '')
+
+    def after_idle(self, callback):
+        callback()
+
+    def tag_configure(self, *args, **kwargs):
+        pass
+
+    tag_raise = tag_bind = mark_set = mark_unset = mark_gravity = yview_moveto = tag_configure
+
+
+class StubVar:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+def summarize(stage, scale, samples, total=None):
+    """
+    Returns one result row from per-item timings in seconds.
+    """
+    ordered = sorted(samples)
+    total = sum(samples) if total is None else total
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000 if ordered else 0.0
+
+    return {
+        'scale': scale,
+        'stage': stage,
+        'n': len(samples),
+        'total_s': round(total, 6),
+        'mean_ms': round(sum(samples) / len(samples) * 1000, 4) if samples else 0.0,
+        'p50_ms': round(pct(50), 4),
+        'p95_ms': round(pct(95), 4),
+        'max_ms': round(ordered[-1] * 1000, 4) if ordered else 0.0,
+    }
+
+
+def prepare_corpus(workdir, scale, args):
+    """
+    Generates the corpus for a scale once and reuses it on later runs.
+    """
+    params = {'files': scale, 'messages': args.messages, 'message_length': args.message_length,
+              'senders': args.senders, 'seed': args.seed}
+    corpus_dir = Path(workdir) / f"corpus_{scale}"
+    marker = corpus_dir.parent / f"corpus_{scale}.params.json"
+    if marker.exists() and json.loads(marker.read_text()) == params:
+        return corpus_dir
+    shutil.rmtree(corpus_dir, ignore_errors=True)
+    print(f"Generating {scale} conversations in {corpus_dir}...")
+    generate_corpus(corpus_dir, scale, args.messages, args.message_length, args.senders, args.seed)
+    marker.write_text(json.dumps(params))
+    return corpus_dir
+
+
+def bench_discovery(corpus_dir, scale):
+    scanner = CorpusScanner(corpus_dir)
+    scanner.manifest_file.unlink(missing_ok=True)
+    results = []
+    for stage in ('discovery_cold', 'discovery_warm'):
+        scanner = CorpusScanner(corpus_dir)
+        start = time.perf_counter()
+        batches = scanner.scan()
+        first = next(batches)
+        first_batch = time.perf_counter() - start
+        paths = first + [path for batch in batches for path in batch]
+        total = time.perf_counter() - start
+        results.append(summarize(f"{stage}_first_batch", scale, [first_batch]))
+        results.append(summarize(stage, scale, [total]))
+    return results, paths
+
+
+def bench_parse(paths, scale):
+    samples = []
+    conversations = []
+    for path in paths:
+        start = time.perf_counter()
+        data = parsing.loads(path.read_bytes())
+        samples.append(time.perf_counter() - start)
+        conversations.append(data)
+    return [summarize('parse', scale, samples)], conversations
+
+
+def bench_render(conversations, sample):
+    view = ConversationView(StubText(), AVAILABLE_COLORS)
+    labeler = SimpleNamespace(conversation_view=view, current_data=None)
+    first_paint, full = [], []
+    for data in conversations[:sample]:
+        labeler.current_data = data
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ConversationLabeler.display_conversation(labeler)
+        first_paint.append(time.perf_counter() - start)
+        # Scrolling through to the end renders the remaining chunks
+        while view.rendered < len(view.messages):
+            view.render_more()
+        full.append(time.perf_counter() - start)
+    return first_paint, full
+
+
+def bench_save(paths, conversations, scale, workdir, sample):
+    db_file = Path(workdir) / f"bench_{scale}.db"
+    for suffix in ('', '-wal', '-shm'):
+        Path(f"{db_file}{suffix}").unlink(missing_ok=True)
+
+    # Pre-fill the store so saves run against scale conversations' worth of labels
+    store = LabelStore(db_file)
+    store.save_conversations(
+        (path.stem, [{'segment': segment, 'sentiment': 3} for segment in SEGMENTS]) for path in paths
+    )
+
+    direct = []
+    for path in paths[:sample]:
+        start = time.perf_counter()
+        store.save_conversation(path.stem, [{'segment': segment, 'sentiment': 4} for segment in SEGMENTS])
+        direct.append(time.perf_counter() - start)
+
+    writer = LabelWriter(db_file)
+    labeler = SimpleNamespace(
+        current_data=None, current_features=None, active_stream=None, json_files=paths, current_file_index=0,
+        segments=SEGMENTS, segment_mode_var=StubVar(3), writer=writer, labeled_ids=set(),
+        duplicates={}, dedup_var=StubVar(True), saved_labels={},
+        label_positions={metric.column: idx for idx, metric in enumerate(SCHEMA.metrics)},
+        show_notification=lambda *args, **kwargs: None,
+        metric_rows={segment: {metric.name: SimpleNamespace(metric=metric, get=StubVar(value).get)
+                               for metric, value in zip(SCHEMA.metrics, (4, 3, 2, 'Manual'))}
+                     for segment in SEGMENTS},
+    )
+    ui = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for idx in range(min(sample, len(paths))):
+            labeler.current_file_index = idx
+            labeler.current_data = conversations[idx]
+            start = time.perf_counter()
+            ConversationLabeler.save_current(labeler)
+            ui.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    writer.close()
+    drain = time.perf_counter() - start
+    store.close()
+
+    return [
+        summarize('save_store_commit', scale, direct),
+        summarize('save_current_ui', scale, ui),
+        summarize('save_writer_drain', scale, [drain]),
+    ]
+
+
+def compare(results, baseline_file):
+    """
+    Prints the p50 and total of each stage relative to a previous results file.
+    """
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = {(row['scale'], row['stage']): row for row in json.load(f)['results']}
+    print(f"\n{'scale':>8} {'stage':<28} {'metric':<8} {'now':>10} {'base':>10} {'ratio':>7}")
+    for row in results:
+        old = baseline.get((row['scale'], row['stage']))
+        if not old:
+            continue
+        key = 'p50_ms' if row['n'] > 1 else 'total_s'
+        ratio = row[key] / old[key] if old[key] else float('nan')
+        print(f"{row['scale']:>8} {row['stage']:<28} {key:<8} {row[key]:>10.3f} {old[key]:>10.3f} {ratio:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the conversation labeler on synthetic corpora.")
+    parser.add_argument('--scales', default="1000,10000,100000", help="Comma-separated corpus sizes")
+    parser.add_argument('--messages', type=int, default=20)
+    parser.add_argument('--message-length', type=int, default=120)
+    parser.add_argument('--senders', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sample', type=int, default=500, help="Conversations rendered and saved per scale")
+    parser.add_argument('--workdir', default=None, help="Where corpora are generated and kept (default: a temp dir)")
+    parser.add_argument('--output', default="benchmark_results.json")
+    parser.add_argument('--baseline', default=None, help="Previous results file to compare against")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir or Path(tempfile.gettempdir()) / "meta_labeler_bench")
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    results = []
+    for scale in (int(value) for value in args.scales.split(',')):
+        corpus_dir = prepare_corpus(workdir, scale, args)
+        rows, paths = bench_discovery(corpus_dir, scale)
+        results.extend(rows)
+        rows, conversations = bench_parse(paths, scale)
+        results.extend(rows)
+        first_paint, full = bench_render(conversations, args.sample)
+        results.append(summarize('render_first_paint', scale, first_paint))
+        results.append(summarize('render_full', scale, full))
+        results.extend(bench_save(paths, conversations, scale, workdir, args.sample))
+        for row in results:
+            if row['scale'] == scale:
+                print(f"{scale:>8} {row['stage']:<28} total {row['total_s']:>9.3f}s  p50 {row['p50_ms']:>9.3f}ms  p95 {row['p95_ms']:>9.3f}ms")
+
+    report = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'json_backend': 'orjson' if parsing.orjson is not None else 'json',
+            'params': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'workdir')},
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
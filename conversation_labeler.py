@@ -1,57 +1,179 @@
+import time
+
+# Taken before the remaining imports so that startup timing includes them
+STARTED_AT = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, Canvas, Scrollbar
 import json
-import pandas as pd
 from pathlib import Path
 import os
+import argparse
+import queue
+import re
 import threading
-import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+
+from archives import ARCHIVE_SUFFIXES, GzipFileEntry, is_archive, is_gzip_file, open_archive
+from conversation_view import ConversationView
+from corpus import CorpusScanner
+from features import ConversationFeatures, conversation_features, featurize_corpus
+from indexing import build_indexes
+from instrumentation import SessionProfiler, metrics
+from label_schema import is_numeric, load_schema
+from label_store import LabelStore, LabelWriter
+from metric_row import MetricRow
+from parsing import RawMessages, StreamingConversationParser
+from prefetch import Prefetcher
+from search import SearchIndex
+from shards import NdjsonShard, SHARD_SUFFIXES, is_shard
+from templates import TemplateIndex, responder_messages
+from work_queue import WorkQueue
 
 # Ensure you have the required packages installed:
 # pip install pandas openpyxl
+# (pandas and openpyxl are only imported when exporting to or importing from Excel)
 
 print("Current Working Directory:", os.getcwd())
 print("Python Version:", os.sys.version)
 
+# Orderings offered by the queue bar, as ORDER BY expressions over the feature index
+QUEUE_ORDERS = {
+    "Queue order": None,
+    "Most messages": "total_messages DESC",
+    "Fewest messages": "total_messages ASC",
+    "Most senders": "distinct_senders DESC",
+    "Longest": "(message_sent_length + message_received_length) DESC",
+    "Most recent activity": "last_activity DESC",
+    "Oldest activity": "last_activity ASC",
+    "Least automated": "automated_share ASC",
+}
+
+def format_duration(seconds):
+    """
+    Formats seconds as e.g. "45s", "12m", "3h 5m" or "2d 4h"; "n/a" if unknown.
+    """
+    if seconds is None:
+        return "n/a"
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m"
+    if seconds < 86400:
+        return f"{seconds // 3600}h {seconds // 60 % 60}m"
+    return f"{seconds // 86400}d {seconds // 3600 % 24}h"
+
 class ConversationLabeler:
-    def __init__(self, root):
+    def __init__(self, root, corpus_path=None, prefetch_depth=8, prefetch_workers=2, cache_max_mb=256, stream_threshold_mb=4,
+                 metrics_file="labeler_metrics.jsonl", show_metrics=False, shared_queue=None, schema=None,
+                 watch=False, watch_interval=2.0, templated_share=0.5, dedup_ignore_digits=False):
         self.root = root
+        self.corpus_path = corpus_path
+        self.metrics_file = metrics_file
+        self.show_metrics = show_metrics
         self.root.title("Conversation Labeler")
         self.root.geometry("1600x800")  # Increased width to accommodate new layout
 
         # Data storage
         self.current_file_index = 0
-        self.json_files = []
+        # Every discovered file in discovery order; json_files is the queue being
+        # labeled, which is all_files itself unless it was sorted or filtered
+        self.all_files = []
+        self.json_files = self.all_files
         self.current_data = None
+        # Features of a streamed conversation, computed while it is parsed
+        self.current_features = None
+
+        # Corpus discovery runs in the background and hands over batches of files
+        self.scanner = None
+        self.shards = []  # Open shards and archives
+        self.scan_queue = queue.Queue()
+        self.scanning = False
+        self.waiting_for_files = False
+
+        # Watch mode keeps picking up files added, changed or removed after discovery
+        self.watch = watch
+        self.watch_interval = watch_interval
+        self.watch_queue = queue.Queue()
+        self.stop_watch = threading.Event()
+
+        # Per-conversation features behind the sort/filter bar, built after discovery
+        self.index_ready = False
+        self.index_progress = (0, 0)
+        # One index build runs at a time; files found meanwhile wait here (name -> entry)
+        self.indexing = False
+        self.index_pending = {}
+        self.index_stale = False
+        # Set on shutdown so a running build stops handing out work
+        self.stop_index = threading.Event()
+        # conversation_id -> every conversation_id of its duplicate group (shared lists)
+        self.duplicates = {}
+        # Group threads that differ only in numbers as well (opt-in: they get the same labels)
+        self.dedup_ignore_digits = dedup_ignore_digits
+
+        # conversation_ids already labeled for the active segment mode
+        self.labeled_ids = set()
+        self.resuming = True
+
+        # Parses upcoming conversations in the background into a bounded LRU cache;
+        # files above the threshold are streamed instead (see stream_conversation)
+        self.prefetcher = Prefetcher(depth=prefetch_depth, workers=prefetch_workers,
+                                     max_bytes=cache_max_mb * 1024 * 1024,
+                                     max_file_bytes=stream_threshold_mb * 1024 * 1024)
+        self.active_stream = None
+        self.ready_reported = False
         self.output_file = "labeled_conversations.xlsx"
 
-        # Initialize the DataFrame for storing labels if it doesn't exist
-        if not Path(self.output_file).exists():
-            self.df = pd.DataFrame(columns=[
-                'conversation_id', 'segment', 'sentiment', 'engagement_score',
-                'customer_effort_score', 'response_type', 'comments',
-                'message_sent_length', 'message_received_length', 'total_messages'
-            ])
-            self.df.to_excel(self.output_file, index=False)
-        else:
-            self.df = pd.read_excel(self.output_file)
-
-        # Store colors for different segments
-        self.segment_colors = {
-            'Intake': '#FFCCCC',      # Light Red
-            'Engaged': '#FFFF99',     # Light Yellow
-            'Qualified': '#CCFFCC'    # Light Green
-        }
-
-        # Dictionary to hold segment frames and their widgets
-        self.segment_vars = {}
-
-        # Define segments
-        self.segments = ['Intake', 'Engaged', 'Qualified']
-
-        # Dictionary to map senders to colors
-        self.sender_colors = {}
-        self.next_color_index = 0
+        # Segments, metrics and their scales (label_schema.json unless another schema is given)
+        self.schema = schema or load_schema()
+        self.segments = [segment.name for segment in self.schema.segments]
+        # segment name -> metric name -> MetricRow
+        self.metric_rows = {}
+        self.store_file = shared_queue or "labeled_conversations.db"
+
+        # With a shared queue, several annotators lease work from one database that
+        # also holds their labels, so completing an item and saving it is one commit
+        store_options = {'journal_mode': "DELETE", 'track_work': True} if shared_queue else {}
+        store_options['metric_columns'] = [metric.column for metric in self.schema.metrics]
+        self.store_options = store_options
+        self.work_queue = WorkQueue(shared_queue) if shared_queue else None
+        self.leased = deque()
+        self.file_index = {}
+        self.stop_heartbeat = threading.Event()
+
+        # Labels are kept in an embedded database; the Excel file is an export
+        self.store = LabelStore(self.store_file, **store_options)
+        if not shared_queue and self.store.is_empty() and Path(self.output_file).exists():
+            # Carry over labels saved by earlier versions straight to the workbook.
+            # One-time migration: later starts never read the workbook.
+            imported = self.store.import_excel(self.output_file)
+            print(f"Imported {imported} labeled rows from {self.output_file}")
+        # Saved labels of every conversation, read once and updated on each save, so
+        # that reopening a conversation fills in its labels without a query
+        self.saved_labels = self.store.saved_labels()
+        self.label_positions = {column: idx for idx, column in enumerate(self.store.metric_columns)}
+        # Conversations opened this session, for Back and Forward
+        self.history = []
+        self.history_pos = -1
+        # Replies repeated across the corpus, used to suggest "Templated" once at
+        # least templated_share of a conversation's replies match. Lookups run on
+        # one background thread, which opens its own index on first use
+        self.templated_share = templated_share
+        self.template_lookups = ThreadPoolExecutor(max_workers=1, thread_name_prefix="templates")
+        self.templates = None
+        # Full-text index for the search box
+        self.search_index = SearchIndex(self.store_file, journal_mode=store_options.get('journal_mode', "WAL"))
+        # (conversation_id, message position, words) of the search result being opened
+        self.pending_highlight = None
+        self.search_results = []
+        # Saves are written behind by a background thread so the UI never waits on disk
+        self.writer = LabelWriter(self.store_file, on_error=self.report_save_error, **store_options)
+        if self.work_queue is not None:
+            threading.Thread(target=self.heartbeat_leases, daemon=True).start()
+
+        # Colors assigned to senders in order of appearance
         self.available_colors = [
             '#ADD8E6',  # Light Blue
             '#90EE90',  # Light Green
@@ -66,8 +188,10 @@ class ConversationLabeler:
         ]
 
         self.setup_ui()
+        self.refresh_labeled_ids()
         self.load_json_files()
         self.bind_keys()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def setup_ui(self):
         # Apply a modern theme and font
@@ -89,27 +213,74 @@ class ConversationLabeler:
 
         # Conversation Display (Left Panel)
         tk.Label(left_panel, text="Conversation", font=('Segoe UI', 16, 'bold'), bg='white').pack(anchor=tk.W, padx=10, pady=10)
+
+        # Queue bar: reorders and filters the queue by the feature index
+        queue_bar = tk.Frame(left_panel, bg='white')
+        queue_bar.pack(fill="x", padx=10, pady=(0, 5))
+        tk.Label(queue_bar, text="Sort:", bg='white').pack(side=tk.LEFT)
+        self.sort_var = tk.StringVar(value="Queue order")
+        ttk.Combobox(queue_bar, textvariable=self.sort_var, values=list(QUEUE_ORDERS), state="readonly", width=20).pack(side=tk.LEFT, padx=(2, 8))
+        tk.Label(queue_bar, text="Min messages:", bg='white').pack(side=tk.LEFT)
+        self.min_messages_var = tk.StringVar(value="0")
+        ttk.Spinbox(queue_bar, from_=0, to=100000, textvariable=self.min_messages_var, width=6).pack(side=tk.LEFT, padx=(2, 8))
+        tk.Label(queue_bar, text="Min senders:", bg='white').pack(side=tk.LEFT)
+        self.min_senders_var = tk.StringVar(value="0")
+        ttk.Spinbox(queue_bar, from_=0, to=100, textvariable=self.min_senders_var, width=4).pack(side=tk.LEFT, padx=(2, 8))
+        self.hide_automated_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(queue_bar, text="Mostly human", variable=self.hide_automated_var).pack(side=tk.LEFT, padx=(0, 8))
+        # Shows one conversation per duplicate group; its labels are saved for the whole group
+        self.dedup_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(queue_bar, text="Collapse duplicates", variable=self.dedup_var).pack(side=tk.LEFT, padx=(0, 8))
+        self.apply_filter_button = ttk.Button(queue_bar, text="Apply", command=self.apply_queue_filter, state="disabled")
+        self.apply_filter_button.pack(side=tk.LEFT)
+        self.index_status_var = tk.StringVar(value="")
+        tk.Label(queue_bar, textvariable=self.index_status_var, bg='white', fg='gray').pack(side=tk.LEFT, padx=8)
+
+        # Search box: full-text search over messages and senders, results open on double-click
+        search_bar = tk.Frame(left_panel, bg='white')
+        search_bar.pack(fill="x", padx=10, pady=(0, 5))
+        self.search_var = tk.StringVar(value="")
+        search_entry = ttk.Entry(search_bar, textvariable=self.search_var)
+        search_entry.pack(side=tk.LEFT, fill="x", expand=True)
+        search_entry.bind('<Return>', lambda event: self.run_search())
+        ttk.Button(search_bar, text="🔍 Search", command=self.run_search).pack(side=tk.LEFT, padx=(5, 0))
+        self.search_results_list = tk.Listbox(left_panel, height=6, font=('Segoe UI', 9), activestyle='dotbox')
+        self.search_results_list.bind('<Double-Button-1>', lambda event: self.open_search_result())
+        self.search_results_list.bind('<Return>', lambda event: self.open_search_result())
+        self.search_results_list.bind('<Escape>', lambda event: self.search_results_list.pack_forget())
+
+        # How quickly the responders answered the lead in the conversation on screen
+        self.response_times_var = tk.StringVar(value="")
+        tk.Label(left_panel, textvariable=self.response_times_var, font=('Segoe UI', 10), bg='white', fg='#505050', anchor='w').pack(fill="x", padx=10, pady=(0, 5))
+
         self.conversation_text = scrolledtext.ScrolledText(left_panel, wrap=tk.WORD, width=60, state='disabled', font=('Segoe UI', 10), bg='#F5F5F5')
         self.conversation_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
 
+        # Renders only the messages near the viewport and loads more on scroll
+        self.conversation_view = ConversationView(self.conversation_text, self.available_colors)
+
         # Labeling Controls (Right Panel)
         segmentation_frame = ttk.LabelFrame(right_panel, text="Segmentation Control")
         segmentation_frame.pack(fill="x", padx=10, pady=10)
 
-        self.segment_mode_var = tk.IntVar(value=3)  # Default to all segments enabled
+        self.segment_mode_var = tk.IntVar(value=len(self.segments))  # Default to all segments enabled
 
         ttk.Label(segmentation_frame, text="Select Segments to Label:", font=('Segoe UI', 12, 'bold')).pack(anchor="w", pady=(0, 5))
 
-        modes = [
-            ("Label Intake Only", 1),
-            ("Label Intake and Engaged", 2),
-            ("Label All Segments", 3)
-        ]
+        # Mode N labels the first N segments
+        modes = [(f"Label {self.segments[0]} Only", 1)]
+        for mode in range(2, len(self.segments)):
+            modes.append((f"Label {', '.join(self.segments[:mode - 1])} and {self.segments[mode - 1]}", mode))
+        if len(self.segments) > 1:
+            modes.append(("Label All Segments", len(self.segments)))
 
         for idx, (text, mode) in enumerate(modes):
             rb = ttk.Radiobutton(segmentation_frame, text=text, variable=self.segment_mode_var, value=mode, command=self.update_active_segments)
             rb.pack(anchor="w", pady=1)  # Reduced pady
 
+        self.hide_labeled_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(segmentation_frame, text="Hide labeled conversations", variable=self.hide_labeled_var).pack(anchor="w", pady=(5, 1))
+
         # Create separate sections for each segment
         self.create_segment_frames(right_panel)
 
@@ -123,6 +294,23 @@ class ConversationLabeler:
         tk.Button(button_frame, text="💾 Save", command=self.save_current, font=('Segoe UI', 12), width=15).pack(side=tk.LEFT, padx=5, pady=2)
         tk.Button(button_frame, text="⏭️ Skip", command=self.skip_current, font=('Segoe UI', 12), width=15).pack(side=tk.LEFT, padx=5, pady=2)
 
+        # Back/Forward move through the conversations opened this session; Go to jumps to a queue position
+        nav_frame = tk.Frame(right_panel)
+        nav_frame.pack(pady=2)
+        tk.Button(nav_frame, text="⬅️ Back", command=lambda: self.go_history(-1), font=('Segoe UI', 12), width=10).pack(side=tk.LEFT, padx=5)
+        tk.Button(nav_frame, text="Forward ➡️", command=lambda: self.go_history(1), font=('Segoe UI', 12), width=10).pack(side=tk.LEFT, padx=5)
+        self.goto_var = tk.StringVar(value="")
+        self.goto_entry = ttk.Entry(nav_frame, textvariable=self.goto_var, width=8)
+        self.goto_entry.pack(side=tk.LEFT, padx=(10, 2))
+        self.goto_entry.bind('<Return>', lambda event: self.go_to())
+        tk.Button(nav_frame, text="Go to #", command=self.go_to, font=('Segoe UI', 12), width=8).pack(side=tk.LEFT, padx=2)
+
+        export_frame = tk.Frame(right_panel)
+        export_frame.pack(pady=2)
+        tk.Button(export_frame, text="📤 Export to Excel", command=self.export_labels, font=('Segoe UI', 12), width=15).pack(side=tk.LEFT, padx=5)
+        tk.Button(export_frame, text="📊 Dashboard", command=self.open_dashboard, font=('Segoe UI', 12), width=15).pack(side=tk.LEFT, padx=5)
+        self.dashboard = None
+
         # Progress Label
         self.progress_var = tk.StringVar(value="Conversation 0/0")
         tk.Label(right_panel, textvariable=self.progress_var, font=('Segoe UI', 12, 'bold')).pack(pady=5)  # Reduced pady
@@ -132,69 +320,58 @@ class ConversationLabeler:
         self.progress_bar.pack(pady=2)  # Reduced pady
         self.update_progress_bar()
 
-        # Explanations Panel (Rightmost Panel)
-        self.create_explanations_panel(explanation_panel)
+        # Response type suggestion from the template index
+        self.suggestion_var = tk.StringVar(value="")
+        tk.Label(right_panel, textvariable=self.suggestion_var, font=('Segoe UI', 10), fg='#505050', wraplength=400).pack(pady=2)
+
+        # Explanations Panel (Rightmost Panel), filled in once the first conversation is up
+        self.explanation_panel = explanation_panel
+        self.explanations_built = False
+        self.root.after(2000, self.ensure_explanations_panel)
 
         # Notification Label (Transient)
         self.notification_label = tk.Label(main_frame, text="", font=('Segoe UI', 10, 'bold'), bg='#D3D3D3', fg='black')
         self.notification_label.place(relx=0.5, rely=0.05, anchor='n')  # Position at top center
 
+        # Latency overlay (toggled with F12)
+        self.metrics_label = tk.Label(main_frame, text="", font=('Consolas', 9), bg='#202020', fg='#E0E0E0', justify='left', anchor='w')
+        if self.show_metrics:
+            self.toggle_metrics_overlay(force=True)
+
+    def ensure_explanations_panel(self):
+        """
+        Builds the explanations panel the first time it is needed.
+        """
+        if not self.explanations_built:
+            self.explanations_built = True
+            self.create_explanations_panel(self.explanation_panel)
+
     def create_explanations_panel(self, parent):
         """
-        Creates the explanations panel on the right side.
+        Creates the explanations panel on the right side from the label schema.
         """
         tk.Label(parent, text="Segment Definitions", font=('Segoe UI', 14, 'bold'), bg='white').pack(pady=5)
 
         # Segment Definitions
         segment_definitions_frame = tk.Frame(parent, bg='white')
         segment_definitions_frame.pack(fill="x", padx=5, pady=2)  # Reduced padding
-        definitions_text = (
-            "• **Intake**: Initial stage with basic user interactions.\n"
-            "• **Engaged**: Active user interactions and follow-up questions.\n"
-            "• **Qualified**: User shows strong interest or readiness to proceed."
-        )
+        definitions_text = "\n".join(f"• **{segment.name}**: {segment.description}" for segment in self.schema.segments)
         tk.Label(segment_definitions_frame, text=definitions_text, bg='white', font=('Segoe UI', 10), justify='left').pack(anchor='w')
 
         tk.Label(parent, text="Metric Explanations", font=('Segoe UI', 14, 'bold'), bg='white').pack(pady=5)
 
-        # Sentiment Explanation
-        sentiment_explanation_frame = tk.Frame(parent, bg='white')
-        sentiment_explanation_frame.pack(fill="x", padx=5, pady=2)  # Reduced padding
-        tk.Label(sentiment_explanation_frame, text="Sentiment Score:", font=('Segoe UI', 12, 'bold'), bg='white').pack(anchor='w')
-        sentiment_text = (
-            "1: Very Negative\n"
-            "2: Negative\n"
-            "3: Neutral\n"
-            "4: Positive\n"
-            "5: Very Positive"
-        )
-        tk.Label(sentiment_explanation_frame, text=sentiment_text, bg='white', font=('Segoe UI', 10), justify='left').pack(anchor='w')
-
-        # Engagement Explanation
-        engagement_explanation_frame = tk.Frame(parent, bg='white')
-        engagement_explanation_frame.pack(fill="x", padx=5, pady=2)  # Reduced padding
-        tk.Label(engagement_explanation_frame, text="Engagement Score:", font=('Segoe UI', 12, 'bold'), bg='white').pack(anchor='w')
-        engagement_text = (
-            "1: Minimal engagement\n"
-            "2: Low engagement\n"
-            "3: Moderate engagement\n"
-            "4: High engagement\n"
-            "5: Very high engagement"
-        )
-        tk.Label(engagement_explanation_frame, text=engagement_text, bg='white', font=('Segoe UI', 10), justify='left').pack(anchor='w')
-
-        # CES Explanation
-        ces_explanation_frame = tk.Frame(parent, bg='white')
-        ces_explanation_frame.pack(fill="x", padx=5, pady=2)  # Reduced padding
-        tk.Label(ces_explanation_frame, text="Customer Effort Score (CES):", font=('Segoe UI', 12, 'bold'), bg='white').pack(anchor='w')
-        ces_text = (
-            "1: Very Low Effort\n"
-            "2: Low Effort\n"
-            "3: Neutral Effort\n"
-            "4: High Effort\n"
-            "5: Very High Effort"
-        )
-        tk.Label(ces_explanation_frame, text=ces_text, bg='white', font=('Segoe UI', 10), justify='left').pack(anchor='w')
+        for metric in self.schema.metrics:
+            if not metric.explanations:
+                continue
+            explanation_frame = tk.Frame(parent, bg='white')
+            explanation_frame.pack(fill="x", padx=5, pady=2)  # Reduced padding
+            tk.Label(explanation_frame, text=f"{metric.explanation_title}:", font=('Segoe UI', 12, 'bold'), bg='white').pack(anchor='w')
+            pairs = list(zip(metric.values, metric.explanations))
+            if is_numeric(metric):
+                # Scales read from low to high, whatever order the buttons are in
+                pairs.sort()
+            explanation_text = "\n".join(f"{value}: {text}" for value, text in pairs)
+            tk.Label(explanation_frame, text=explanation_text, bg='white', font=('Segoe UI', 10), justify='left').pack(anchor='w')
 
     def bind_keys(self):
         """
@@ -202,315 +379,964 @@ class ConversationLabeler:
         - Enter: Save & Next
         - '0': Save
         - '9': Skip (with confirmation)
+        - Ctrl+E: Export labels to Excel
+        - Alt+Left / Alt+Right: Back / Forward through the session history
+        - Ctrl+G: Go to a conversation number
+        - F12: Show/hide the latency overlay
         """
-        self.root.bind('<Return>', lambda event: self.save_and_next())
-        self.root.bind('<Key-0>', lambda event: self.save_current())
-        self.root.bind('<Key-9>', lambda event: self.skip_current())
+        # Keys typed into the search box and queue bar fields are not shortcuts
+        self.root.bind('<Return>', lambda event: None if self.in_text_field(event) else self.save_and_next())
+        self.root.bind('<Key-0>', lambda event: None if self.in_text_field(event) else self.save_current())
+        self.root.bind('<Key-9>', lambda event: None if self.in_text_field(event) else self.skip_current())
+        self.root.bind('<Control-e>', lambda event: self.export_labels())
+        self.root.bind('<Alt-Left>', lambda event: None if self.in_text_field(event) else self.go_history(-1))
+        self.root.bind('<Alt-Right>', lambda event: None if self.in_text_field(event) else self.go_history(1))
+        self.root.bind('<Control-g>', lambda event: self.goto_entry.focus_set())
+        self.root.bind('<F12>', lambda event: self.toggle_metrics_overlay())
+
+    def in_text_field(self, event):
+        return isinstance(event.widget, (tk.Entry, ttk.Entry, tk.Listbox))
 
     def create_segment_frames(self, parent):
         """
-        Creates frames for each segment in the user interface.
+        Creates a frame per segment with one metric row per metric of the schema.
         """
-        for idx, segment in enumerate(self.segments):
-            frame = ttk.LabelFrame(parent, text=segment)
+        for segment in self.schema.segments:
+            frame = ttk.LabelFrame(parent, text=segment.name)
             frame.pack(fill="x", padx=10, pady=5)  # Reduced pady
 
             # Set the background color for the frame
-            frame.configure(style=f"{segment}.TLabelframe")
-
-            # Sentiment Score
-            sentiment_frame = tk.Frame(frame, bg='#333333')  # Dark when unselected
-            sentiment_frame.pack(anchor="w", pady=2, fill="x")  # Reduced pady
-            tk.Label(sentiment_frame, text="Sentiment Score", bg='#333333', font=('Segoe UI', 10, 'bold')).pack(side=tk.LEFT, padx=(0, 5))
-
-            sentiment_var = tk.IntVar(value=0)  # No default selection
-            for i in range(1, 6):
-                rb = tk.Radiobutton(sentiment_frame, text=str(i), variable=sentiment_var, value=i, bg='#333333', font=('Segoe UI', 10, 'bold'))
-                rb.pack(side=tk.LEFT, padx=2)  # Align to the left
-            self.segment_vars[f"{segment}_sentiment_var"] = sentiment_var
-
-            # Add trace to update background
-            def update_sentiment_bg(*args, seg=segment, var=sentiment_var, frame=sentiment_frame):
-                if var.get() > 0:
-                    frame.configure(bg=self.segment_colors[seg])
-                    for widget in frame.winfo_children():
-                        if isinstance(widget, tk.Label) or isinstance(widget, tk.Radiobutton):
-                            widget.configure(bg=self.segment_colors[seg])
-                else:
-                    frame.configure(bg='#333333')
-                    for widget in frame.winfo_children():
-                        if isinstance(widget, tk.Label) or isinstance(widget, tk.Radiobutton):
-                            widget.configure(bg='#333333')
-
-            sentiment_var.trace_add("write", update_sentiment_bg)
-
-            # Engagement Score
-            engagement_frame = tk.Frame(frame, bg='#333333')
-            engagement_frame.pack(anchor="w", pady=2, fill="x")  # Reduced pady
-            tk.Label(engagement_frame, text="Engagement Score", bg='#333333', font=('Segoe UI', 10, 'bold')).pack(side=tk.LEFT, padx=(0, 5))
-
-            engagement_var = tk.IntVar(value=0)  # No default selection
-            for i in range(1, 6):
-                rb = tk.Radiobutton(engagement_frame, text=str(i), variable=engagement_var, value=i, bg='#333333', font=('Segoe UI', 10, 'bold'))
-                rb.pack(side=tk.LEFT, padx=2)
-            self.segment_vars[f"{segment}_engagement_var"] = engagement_var
-
-            def update_engagement_bg(*args, seg=segment, var=engagement_var, frame=engagement_frame):
-                if var.get() > 0:
-                    frame.configure(bg=self.segment_colors[seg])
-                    for widget in frame.winfo_children():
-                        if isinstance(widget, tk.Label) or isinstance(widget, tk.Radiobutton):
-                            widget.configure(bg=self.segment_colors[seg])
-                else:
-                    frame.configure(bg='#333333')
-                    for widget in frame.winfo_children():
-                        if isinstance(widget, tk.Label) or isinstance(widget, tk.Radiobutton):
-                            widget.configure(bg='#333333')
-
-            engagement_var.trace_add("write", update_engagement_bg)
-
-            # Customer Effort Score
-            ces_frame = tk.Frame(frame, bg='#333333')
-            ces_frame.pack(anchor="w", pady=2, fill="x")  # Reduced pady
-            tk.Label(ces_frame, text="Customer Effort Score", bg='#333333', font=('Segoe UI', 10, 'bold')).pack(side=tk.LEFT, padx=(0, 5))
-
-            ces_var = tk.IntVar(value=0)  # No default selection
-            for i in range(5, 0, -1):  # From 5 to 1
-                rb = tk.Radiobutton(ces_frame, text=str(i), variable=ces_var, value=i, bg='#333333', font=('Segoe UI', 10, 'bold'))
-                rb.pack(side=tk.LEFT, padx=2)  # Align to the left
-            self.segment_vars[f"{segment}_ces_var"] = ces_var
-
-            def update_ces_bg(*args, seg=segment, var=ces_var, frame=ces_frame):
-                if var.get() > 0:
-                    frame.configure(bg=self.segment_colors[seg])
-                    for widget in frame.winfo_children():
-                        if isinstance(widget, tk.Label) or isinstance(widget, tk.Radiobutton):
-                            widget.configure(bg=self.segment_colors[seg])
-                else:
-                    frame.configure(bg='#333333')
-                    for widget in frame.winfo_children():
-                        if isinstance(widget, tk.Label) or isinstance(widget, tk.Radiobutton):
-                            widget.configure(bg='#333333')
-
-            ces_var.trace_add("write", update_ces_bg)
-
-            # Response Type (Radiobuttons aligned to the left)
-            response_frame = tk.Frame(frame, bg='#333333')
-            response_frame.pack(anchor="w", pady=2, fill="x")  # Reduced pady
-            tk.Label(response_frame, text="Response Type", bg='#333333', font=('Segoe UI', 10, 'bold')).pack(side=tk.LEFT, padx=(0, 5))
-            response_type_var = tk.StringVar(value='')  # No default selection
-            response_types = ["Manual", "Templated", "GPT"]
-            for text in response_types:  # Keep the original order
-                rb = tk.Radiobutton(response_frame, text=text, variable=response_type_var, value=text, bg='#333333', font=('Segoe UI', 10, 'bold'))
-                rb.pack(side=tk.LEFT, padx=2)
-            self.segment_vars[f"{segment}_response_type_var"] = response_type_var
-
-            def update_response_type_bg(*args, seg=segment, var=response_type_var, frame=response_frame):
-                if var.get() != '':
-                    frame.configure(bg=self.segment_colors[seg])
-                    for widget in frame.winfo_children():
-                        if isinstance(widget, tk.Label) or isinstance(widget, tk.Radiobutton):
-                            widget.configure(bg=self.segment_colors[seg])
-                else:
-                    frame.configure(bg='#333333')
-                    for widget in frame.winfo_children():
-                        if isinstance(widget, tk.Label) or isinstance(widget, tk.Radiobutton):
-                            widget.configure(bg='#333333')
-
-            response_type_var.trace_add("write", update_response_type_bg)
+            frame.configure(style=f"{segment.name}.TLabelframe")
 
-            # Store all widgets for enabling/disabling
-            self.segment_vars[f"{segment}_widgets"] = {
-                "frame": frame,
-                "widgets_list": frame.winfo_children(),
+            self.metric_rows[segment.name] = {
+                metric.name: MetricRow(frame, metric, segment.color) for metric in self.schema.metrics
             }
 
+    @metrics.track('update_active_segments')
     def update_active_segments(self):
         """
         Enables or disables segment sections based on the selected segmentation mode.
         """
         mode = self.segment_mode_var.get()  # Get the selected mode from the radio buttons
         for idx, segment in enumerate(self.segments, start=1):  # Iterate through all segments
-            widgets = self.segment_vars[f"{segment}_widgets"]
-            if idx <= mode:  # Enable if the segment index is within the selected mode
-                self.enable_segment(widgets)
-            else:  # Disable if it's beyond the selected mode
-                self.disable_segment(widgets)
-
-    def enable_segment(self, widgets):
-        """
-        Enables all input widgets within a segment.
-        """
-        # Enable all widgets in the widgets_list
-        for widget in widgets["widgets_list"]:
-            # Enable Radiobuttons
-            if isinstance(widget, tk.Frame):
-                for child in widget.winfo_children():
-                    child.configure(state="normal")
-            else:
-                widget.configure(state="normal")
+            # Rows skip the update when they already are in that state
+            for row in self.metric_rows[segment].values():
+                row.set_enabled(idx <= mode)
+        # "Labeled" depends on which segments are being labeled
+        self.refresh_labeled_ids()
+
+    def refresh_labeled_ids(self):
+        """
+        Rebuilds the index of conversations labeled for the active segment mode.
 
-    def disable_segment(self, widgets):
+        Built from saved_labels, which includes saves the writer has not
+        committed yet, so it never waits on the disk.
         """
-        Disables all input widgets within a segment and resets their values.
+        active_segments = self.segments[:self.segment_mode_var.get()]
+        self.labeled_ids = {
+            conversation_id for conversation_id, segments in self.saved_labels.items()
+            if all(segment in segments for segment in active_segments)
+        }
+
+    def first_unlabeled(self, index):
         """
-        # Disable all widgets in the widgets_list
-        for widget in widgets["widgets_list"]:
-            # Disable Radiobuttons
-            if isinstance(widget, tk.Frame):
-                for child in widget.winfo_children():
-                    child.configure(state="disabled")
-            else:
-                widget.configure(state="disabled")
-        # Reset all values for the disabled segment
-        segment = widgets["frame"].cget("text")
-        self.segment_vars[f"{segment}_sentiment_var"].set(0)  # Reset sentiment to no selection
-        self.segment_vars[f"{segment}_engagement_var"].set(0)  # Reset engagement to no selection
-        self.segment_vars[f"{segment}_ces_var"].set(0)  # Reset customer effort to no selection
-        self.segment_vars[f"{segment}_response_type_var"].set("")  # Reset response type to no selection
+        Returns the first index at or after index whose conversation is not labeled yet.
+        """
+        while index < len(self.json_files) and self.json_files[index].stem in self.labeled_ids:
+            index += 1
+        return index
 
     def load_json_files(self):
         """
         Loads all JSON files from the 'conversations' directory.
+
+        The path may also point to a JSONL/NDJSON shard with one conversation per
+        line, a .zip/.tar/.tar.gz archive of JSON files, or a single .json.gz
+        file; shards and archives inside the directory are queued after the
+        JSON files.
         """
         # Update the path to your 'conversations' directory
-        json_path = Path(input('Please enter the path to your conversations directory: ') or r"Path to your conversations directory (e.g., './conversations')")
+        if self.corpus_path:
+            json_path = Path(self.corpus_path)
+        else:
+            json_path = Path(input('Please enter the path to your conversations directory: ') or r"Path to your conversations directory (e.g., './conversations')")
         print(f"Looking for conversations in: {json_path}")
 
         if not json_path.exists():
             messagebox.showwarning("No Data", "Please place conversation JSON files in the 'conversations' folder.")
             return
 
-        self.json_files = list(json_path.glob("*.json"))
-        if not self.json_files:
-            messagebox.showwarning("No Files", "No JSON files found in the 'conversations' folder.")
-            return
+        # Show the first conversation as soon as the first batch is discovered
+        self.corpus_path = json_path
+        self.scanner = CorpusScanner(json_path) if json_path.is_dir() else None
+        self.scanning = True
+        self.waiting_for_files = True
+        threading.Thread(target=self.scan_corpus, daemon=True).start()
+        self.root.after(50, self.poll_scan)
 
-        print(f"Loaded {len(self.json_files)} JSON files from 'conversations' folder.")
+    def scan_corpus(self):
+        """
+        Runs the corpus scanner on a worker thread and queues its batches.
+        """
+        start = time.perf_counter()
+        # SQLite connections stay on their thread, so registration gets its own
+        register_queue = WorkQueue(self.store_file, owner=self.work_queue.owner) if self.work_queue else None
+        try:
+            if self.scanner is not None:
+                for idx, batch in enumerate(self.scanner.scan()):
+                    if idx == 0:
+                        metrics.record('file_discovery_first_batch', time.perf_counter() - start)
+                    if register_queue is not None:
+                        register_queue.register([path.stem for path in batch])
+                    self.scan_queue.put(batch)
+                shard_paths = sorted(p for p in self.corpus_path.iterdir() if is_shard(p) or is_archive(p))
+            elif is_gzip_file(self.corpus_path):
+                shard_paths = []
+                self.scan_queue.put([GzipFileEntry(self.corpus_path)])
+            else:
+                shard_paths = [self.corpus_path] if is_shard(self.corpus_path) or is_archive(self.corpus_path) else []
+            for shard_path in shard_paths:
+                # Archives are indexed once and then read member by member, like shards line by line
+                shard = open_archive(shard_path) if is_archive(shard_path) else NdjsonShard(shard_path)
+                self.shards.append(shard)
+                print(f"Indexed {len(shard)} conversations in {shard_path.name}")
+                entries = shard.entries()
+                for offset in range(0, len(entries), 1000):
+                    batch = entries[offset:offset + 1000]
+                    if register_queue is not None:
+                        register_queue.register([entry.stem for entry in batch])
+                    self.scan_queue.put(batch)
+        except Exception as e:
+            self.scan_queue.put(e)
+        if register_queue is not None:
+            register_queue.close()
+        metrics.record('file_discovery', time.perf_counter() - start)
+        self.scan_queue.put(None)
+
+    def poll_scan(self):
+        """
+        Appends newly discovered files to the queue on the UI thread.
+        """
+        discovered = False
+        while True:
+            try:
+                item = self.scan_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None or isinstance(item, Exception):
+                self.scanning = False
+                discovered = True
+                if isinstance(item, Exception):
+                    messagebox.showerror("Error", f"Failed to list conversations: {str(item)}")
+                break
+            for path in item:
+                self.file_index[path.stem] = len(self.all_files)
+                self.all_files.append(path)
+            discovered = True
+
+        if self.waiting_for_files and self.work_queue is not None:
+            # Only ask the shared queue again once there is something new to lease
+            if discovered:
+                index = self.next_leased_index()
+                self.current_file_index = len(self.json_files) if index is None else index
+        elif self.waiting_for_files and (self.resuming or self.hide_labeled_var.get()):
+            self.current_file_index = self.first_unlabeled(self.current_file_index)
         self.update_progress_label()
         self.update_progress_bar()
+        if self.waiting_for_files and self.current_file_index < len(self.json_files):
+            self.waiting_for_files = False
+            if self.resuming and self.current_file_index > 0 and self.work_queue is None:
+                print(f"Resuming at conversation {self.current_file_index + 1}; earlier ones are already labeled.")
+                self.show_notification(f"Resumed at conversation {self.current_file_index + 1}.")
+            self.resuming = False
+            self.load_conversation()
+
+        if self.scanning:
+            self.root.after(50, self.poll_scan)
+        elif not self.json_files:
+            messagebox.showwarning("No Files", f"No JSON files, {'/'.join(SHARD_SUFFIXES)} shards or {'/'.join(ARCHIVE_SUFFIXES)} archives found at the given path.")
+        else:
+            print(f"Loaded {len(self.json_files)} JSON files from 'conversations' folder.")
+            self.start_feature_index()
+            if self.watch and self.scanner is not None:
+                threading.Thread(target=self.watch_corpus, daemon=True).start()
+                self.root.after(500, self.poll_watch)
+            if self.waiting_for_files:
+                self.waiting_for_files = False
+                self.load_conversation()
+
+    def start_feature_index(self, entries=None):
+        """
+        Brings the feature index up to date on a worker thread.
+
+        Without entries the whole corpus is indexed once discovery is done; watch
+        mode passes the files that appeared or changed since then.
+        """
+        if entries is not None:
+            self.index_pending.update((entry.name, entry) for entry in entries)
+            if self.indexing or not self.index_pending:
+                # poll_watch starts the next build once the running one is done
+                return
+            entries = list(self.index_pending.values())
+            self.index_pending = {}
+            stats = None
+            hashes = {entry.name: self.scanner.hash_of(entry) for entry in entries}
+            prune = False
+            self.index_stale = True
+            self.index_status_var.set(f"Indexing {len(entries)} new...")
+        else:
+            stats = hashes = None
+            if self.scanner is not None:
+                stats = {name: (entry['size'], entry['mtime']) for name, entry in self.scanner.entries.items()}
+                hashes = {name: entry['hash'] for name, entry in self.scanner.entries.items()}
+            entries = list(self.all_files)
+            prune = True
+            self.index_status_var.set("Indexing...")
+            self.root.after(500, self.poll_index)
+        self.indexing = True
+        threading.Thread(target=self.build_index, args=(entries, stats, hashes, prune), daemon=True).start()
+
+    def build_index(self, entries, stats, hashes, prune=True):
+        """
+        Runs on the worker thread; only new or changed files are parsed again.
+        """
+        start = time.perf_counter()
+        # SQLite connections stay on their thread, so the indexes get their own
+        index_store = LabelStore(self.store_file, **self.store_options)
+        template_index = TemplateIndex(self.store_file, journal_mode=self.store_options.get('journal_mode', "WAL"))
+        search_index = SearchIndex(self.store_file, journal_mode=self.store_options.get('journal_mode', "WAL"))
+        try:
+            updated = build_indexes(index_store, template_index, search_index, entries, stats=stats, hashes=hashes,
+                                    prune=prune, progress=lambda done, total: setattr(self, 'index_progress', (done, total)),
+                                    stop=self.stop_index)
+            print(f"Indexes up to date; {updated['features']} feature, {updated['templates']} template and "
+                  f"{updated['search']} search entries (re)indexed.")
+            metrics.record('corpus_index', time.perf_counter() - start)
+        except Exception as e:
+            print(f"Error building indexes: {str(e)}")
+        finally:
+            index_store.close()
+            template_index.close()
+            search_index.close()
+            self.index_ready = True
+            self.indexing = False
+
+    def poll_index(self):
+        if self.index_ready:
+            self.index_status_var.set(f"{len(self.all_files)} indexed")
+            self.load_duplicates()
+            # The queue order of a shared queue is decided by the leases
+            if self.work_queue is None:
+                self.apply_filter_button.configure(state="normal")
+                if self.duplicates and self.dedup_var.get():
+                    self.apply_queue_filter(keep_current=True)
+            return
+        done, total = self.index_progress
+        self.index_status_var.set(f"Indexing {done}/{total}..." if total else "Indexing...")
+        self.root.after(500, self.poll_index)
+
+    def watch_corpus(self, full_listing_every=30):
+        """
+        Runs on a worker thread and queues the files added, changed or removed since discovery.
+
+        With the optional watchdog package, file system events (inotify on Linux)
+        trigger a listing. Otherwise the directory mtime is compared every
+        watch_interval seconds, which costs one stat; files edited in place do not
+        move it, so every full_listing_every polls the files are listed anyway.
+        """
+        # SQLite connections stay on their thread, so registration gets its own
+        register_queue = WorkQueue(self.store_file, owner=self.work_queue.owner) if self.work_queue else None
+        wakeup = threading.Event()
+        observer = None
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+
+            class WakeupHandler(FileSystemEventHandler):
+                def on_any_event(self, event):
+                    wakeup.set()
+
+            observer = Observer()
+            observer.schedule(WakeupHandler(), str(self.scanner.root_dir), recursive=False)
+            observer.start()
+            print("Watching for new conversations with file system events.")
+        except Exception as e:
+            # Missing package or no inotify instances left
+            observer = None
+            print(f"Watching for new conversations every {self.watch_interval}s ({str(e)}).")
+
+        polls = 0
+        while not self.stop_watch.is_set():
+            if observer is not None:
+                if not wakeup.wait(self.watch_interval):
+                    continue
+                # A burst of events is covered by one listing a moment later
+                self.stop_watch.wait(0.5)
+                wakeup.clear()
+                trust_dir_mtime = False
+            else:
+                if self.stop_watch.wait(self.watch_interval):
+                    break
+                polls += 1
+                trust_dir_mtime = polls % full_listing_every != 0
+            try:
+                start = time.perf_counter()
+                added, changed, removed = self.scanner.changes(trust_dir_mtime=trust_dir_mtime)
+                if not (added or changed or removed):
+                    continue
+                metrics.record('watch_changes', time.perf_counter() - start)
+                if register_queue is not None and added:
+                    register_queue.register([path.stem for path in added])
+                self.watch_queue.put((added, changed, removed))
+            except Exception as e:
+                print(f"Error watching {self.scanner.root_dir}: {str(e)}")
+        if observer is not None:
+            observer.stop()
+            observer.join()
+        if register_queue is not None:
+            register_queue.close()
+
+    def poll_watch(self):
+        """
+        Applies the changes found by watch mode to the live queue on the UI thread.
+        """
+        added, removed = [], set()
+        while True:
+            try:
+                new_files, changed, gone = self.watch_queue.get_nowait()
+            except queue.Empty:
+                break
+            for path in changed:
+                self.prefetcher.invalidate(path)
+                if self.current_data is not None and self.current_file_index < len(self.json_files) \
+                        and self.json_files[self.current_file_index] == path:
+                    self.show_notification("This conversation changed on disk; the labels are saved against the version on screen.")
+            removed.update(gone)
+            added.extend(new_files)
+            # Edited files are indexed again along with the new ones
+            self.start_feature_index(changed)
+
+        if removed:
+            current = self.json_files[self.current_file_index] if self.current_file_index < len(self.json_files) else None
+            # The conversation on screen stays so that it can still be saved
+            keep = [path for path in self.all_files if path.name not in removed or path == current]
+            if self.json_files is not self.all_files:
+                self.json_files = [path for path in self.json_files if path.name not in removed or path == current]
+            else:
+                self.json_files = keep
+            self.all_files = keep
+            self.file_index = {path.stem: idx for idx, path in enumerate(self.all_files)}
+            for name in removed:
+                self.prefetcher.invalidate(self.scanner.entry(name))
+            if current is not None:
+                self.current_file_index = self.json_files.index(current)
+            else:
+                self.current_file_index = min(self.current_file_index, len(self.json_files))
+        if added:
+            for path in added:
+                if path.stem in self.file_index:
+                    # Re-added under a name removed and restored within one poll
+                    continue
+                self.file_index[path.stem] = len(self.all_files)
+                self.all_files.append(path)
+                if self.json_files is not self.all_files:
+                    # A sorted or filtered queue gets them at the end until the filter is applied again
+                    self.json_files.append(path)
+            self.start_feature_index(added)
+            print(f"Watch: {len(added)} new conversations queued.")
+        if added or removed:
+            self.update_progress_label()
+            self.update_progress_bar()
+
+        if self.index_pending and not self.indexing:
+            self.start_feature_index([])
+        elif self.index_stale and not self.indexing:
+            self.index_stale = False
+            self.load_duplicates()
+            self.index_status_var.set(f"{len(self.all_files)} indexed")
+
+        if self.waiting_for_files and added:
+            if self.work_queue is not None:
+                index = self.next_leased_index()
+                self.current_file_index = len(self.json_files) if index is None else index
+            elif self.hide_labeled_var.get():
+                self.current_file_index = self.first_unlabeled(self.current_file_index)
+            if self.current_file_index < len(self.json_files):
+                self.waiting_for_files = False
+                self.load_conversation()
+        if not self.stop_watch.is_set():
+            self.root.after(500, self.poll_watch)
+
+    @metrics.track('search')
+    def run_search(self):
+        """
+        Searches the full-text index and lists the best-matching conversations.
+        """
+        query = self.search_var.get().strip()
+        if not query:
+            self.search_results_list.pack_forget()
+            return
+        try:
+            self.search_results = self.search_index.search(query)
+        except Exception as e:
+            messagebox.showerror("Search Error", f"Search failed: {str(e)}")
+            return
+        self.search_results_list.delete(0, tk.END)
+        for conversation_id, position, sender, snippet in self.search_results:
+            self.search_results_list.insert(tk.END, f"{conversation_id} #{position + 1} {sender}: {' '.join(snippet.split())}")
+        if not self.search_results:
+            self.show_notification("No matches (conversations still being indexed are not searchable yet).")
+            self.search_results_list.pack_forget()
+            return
+        self.search_results_list.pack(fill="x", padx=10, pady=(0, 5), before=self.conversation_text.frame)
+        self.search_results_list.selection_clear(0, tk.END)
+        self.search_results_list.selection_set(0)
+        self.search_results_list.focus_set()
+
+    def open_search_result(self):
+        """
+        Jumps to the selected search result and highlights its message.
+        """
+        selection = self.search_results_list.curselection()
+        if not selection:
+            return
+        conversation_id, position, _, _ = self.search_results[selection[0]]
+        index = next((idx for idx, path in enumerate(self.json_files) if path.stem == conversation_id), None)
+        if index is None:
+            self.show_notification("That conversation is hidden by the current filter.")
+            return
+        self.cancel_stream()
+        self.current_file_index = index
+        self.pending_highlight = (conversation_id, position, re.findall(r"\w+", self.search_var.get()))
+        self.clear_form()
+        self.load_conversation()
+
+    def show_pending_highlight(self):
+        """
+        Highlights the search hit once its conversation is on screen.
+        """
+        if self.pending_highlight is None:
+            return
+        conversation_id, position, terms = self.pending_highlight
+        if self.json_files[self.current_file_index].stem == conversation_id:
+            self.pending_highlight = None
+            self.conversation_view.highlight(position, terms)
+
+    def load_duplicates(self):
+        """
+        Reads the duplicate groups of the discovered conversations from the feature index.
+        """
+        self.duplicates = {}
+        try:
+            groups = self.store.duplicate_groups(ignore_digits=self.dedup_ignore_digits)
+        except Exception as e:
+            print(f"Error loading duplicate groups: {str(e)}")
+            return
+        for group in groups:
+            group = [conversation_id for conversation_id in group if conversation_id in self.file_index]
+            if len(group) > 1:
+                for conversation_id in group:
+                    self.duplicates[conversation_id] = group
+        if self.duplicates:
+            print(f"Found {len(self.duplicates)} conversations in duplicate groups.")
+
+    def collapse_duplicates(self, files, keep=None):
+        """
+        Returns files with only the first conversation of each duplicate group (or keep, if given).
+        """
+        shown = set()
+        if keep is not None and keep.stem in self.duplicates:
+            shown.add(self.duplicates[keep.stem][0])
+        collapsed = []
+        for path in files:
+            group = self.duplicates.get(path.stem)
+            if group is not None and path != keep:
+                if group[0] in shown:
+                    continue
+                shown.add(group[0])
+            collapsed.append(path)
+        return collapsed
+
+    def apply_queue_filter(self, keep_current=False):
+        """
+        Rebuilds the queue from the feature index using the sort/filter bar.
+
+        With keep_current the conversation on screen stays there instead of the
+        queue starting over; used when duplicates are collapsed automatically.
+        """
+        if self.active_stream is not None and not keep_current:
+            self.show_notification("Conversation is still loading, please try again in a moment.")
+            return
+        if keep_current and (self.current_data is None or self.current_file_index >= len(self.json_files)):
+            # Nothing on screen (e.g. waiting for new files); leave the queue where it is
+            return
+        try:
+            min_messages = int(self.min_messages_var.get() or 0)
+            min_senders = int(self.min_senders_var.get() or 0)
+        except ValueError:
+            messagebox.showerror("Invalid Filter", "Minimum messages and senders must be whole numbers.")
+            return
+        order_by = QUEUE_ORDERS[self.sort_var.get()]
+
+        with metrics.timed('queue_filter'):
+            if order_by is None and not min_messages and not min_senders and not self.hide_automated_var.get():
+                files = self.all_files
+            else:
+                conversation_ids = self.store.query_features(
+                    min_messages=min_messages,
+                    min_senders=min_senders,
+                    # "Mostly human": at most half of the messages are automated
+                    max_automated_share=0.5 if self.hide_automated_var.get() else 1.0,
+                    order_by=order_by,
+                )
+                positions = [self.file_index[conversation_id] for conversation_id in conversation_ids
+                             if conversation_id in self.file_index]
+                if order_by is None:
+                    positions.sort()
+                files = [self.all_files[position] for position in positions]
+            current = self.json_files[self.current_file_index] if keep_current else None
+            if self.dedup_var.get():
+                files = self.collapse_duplicates(files, keep=current)
+
+        if not files:
+            self.show_notification("No conversations match the filter.")
+            return
+        hidden = len(self.json_files) - len(files)
+        if current is not None and current in files:
+            self.json_files = files
+            self.current_file_index = files.index(current)
+            self.update_progress_label()
+            self.update_progress_bar()
+            if hidden > 0:
+                self.show_notification(f"{hidden} duplicate conversations collapsed.")
+            return
+        self.json_files = files
+        self.current_file_index = self.first_unlabeled(0) if self.hide_labeled_var.get() else 0
+        self.clear_form()
+        if self.current_file_index >= len(self.json_files):
+            self.show_notification("Every matching conversation is already labeled.")
+            self.current_file_index = 0
         self.load_conversation()
+        self.show_notification(f"{len(files)} conversations in the queue.")
 
     def load_conversation(self):
         """
         Loads the current conversation and displays it.
         """
         if 0 <= self.current_file_index < len(self.json_files):
+            self.cancel_stream()
             try:
-                with open(self.json_files[self.current_file_index], 'r', encoding='utf-8') as f:
-                    self.current_data = json.load(f)
-                print(f"Loaded conversation: {self.json_files[self.current_file_index].name}")
-                self.display_conversation()
+                # Usually a cache hit; start parsing the files that follow right away
+                path = self.json_files[self.current_file_index]
+                self.remember(path)
+                self.restore_labels(path.stem)
+                data = self.prefetcher.get(path)
+                self.prefetcher.prefetch_ahead(self.json_files, self.current_file_index)
+                if data is None:
+                    # Too large to parse in one go
+                    print(f"Streaming conversation: {path.name}")
+                    self.stream_conversation(path)
+                    self.show_response_times()
+                else:
+                    self.current_data = data
+                    self.current_features = None
+                    print(f"Loaded conversation: {path.name}")
+                    self.display_conversation()
+                    self.suggest_response_type()
+                    self.show_response_times()
+                    self.show_pending_highlight()
                 self.update_progress_label()
                 self.update_progress_bar()
+                if not self.ready_reported:
+                    self.ready_reported = True
+                    # Idle callbacks run after the pending redraw, i.e. once the conversation is visible
+                    self.root.after_idle(self.report_ready)
             except json.JSONDecodeError as e:
                 messagebox.showerror("JSON Error", f"Failed to load conversation due to JSON error: {str(e)}")
                 print(f"JSON error: {str(e)}")
+                self.prefetcher.prefetch_ahead(self.json_files, self.current_file_index)
                 self.next_conversation()
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to load conversation: {str(e)}")
                 print(f"Error loading conversation: {str(e)}")
+                self.prefetcher.prefetch_ahead(self.json_files, self.current_file_index)
                 self.next_conversation()
         else:
             messagebox.showinfo("Complete", "All conversations have been processed!")
             self.root.quit()
 
-    def display_conversation(self):
+    def report_ready(self):
         """
-        Displays the conversation in the scrollable text widget with colored message bubbles.
+        Records time-to-first-interaction and builds the deferred parts of the UI.
         """
-        self.conversation_text.configure(state='normal')
-        self.conversation_text.delete('1.0', tk.END)
+        elapsed = time.perf_counter() - STARTED_AT
+        metrics.record('time_to_first_interaction', elapsed)
+        print(f"Ready for labeling {elapsed:.2f}s after start.")
+        self.ensure_explanations_panel()
 
-        # Clear existing tags
-        for tag in self.conversation_text.tag_names():
-            self.conversation_text.tag_delete(tag)
+    def stream_conversation(self, path):
+        """
+        Parses a large conversation on a worker thread, showing messages as they arrive.
+
+        Only the compressed raw JSON of each message is kept (see
+        RawMessages), and the features are computed while parsing, so the
+        parsed conversation is never held in memory as a whole.
+        """
+        self.current_data = {'conversation_data': RawMessages()}
+        self.current_features = None
+        self.display_conversation()
 
+        cancel = threading.Event()
+        self.active_stream = cancel
+        stream_queue = queue.Queue()
+        threading.Thread(target=self.parse_stream, args=(path, stream_queue, cancel), daemon=True).start()
+        self.root.after(20, self.poll_stream, stream_queue, cancel)
+
+    def parse_stream(self, path, stream_queue, cancel, batch_size=100, max_replies=200):
+        """
+        Runs on the worker thread; queues the raw messages in packed blocks.
+
+        Once parsed, a batch is added to the running features and dropped; only
+        the first max_replies replies are kept, for the template suggestion.
+        """
+        start = time.perf_counter()
+        try:
+            with path.open('rb') as f:
+                parser = StreamingConversationParser(f)
+                features = ConversationFeatures()
+                replies = []
+                batch = []
+                raw_batch = []
+
+                def add_batch():
+                    features.add(batch)
+                    if len(replies) < max_replies:
+                        replies.extend(msg for msg in batch if msg.get('sender') != features.lead)
+                        del replies[max_replies:]
+                    stream_queue.put(('messages', RawMessages.pack(raw_batch)))
+
+                for msg, raw in parser.messages(raw=True):
+                    if cancel.is_set():
+                        return
+                    batch.append(msg)
+                    raw_batch.append(raw)
+                    if len(batch) >= batch_size:
+                        add_batch()
+                        batch = []
+                        raw_batch = []
+                add_batch()
+                stream_queue.put(('done', (parser.header, features.result(), replies)))
+            metrics.record('json_parse_stream', time.perf_counter() - start)
+        except Exception as e:
+            stream_queue.put(('error', e))
+
+    def poll_stream(self, stream_queue, cancel):
+        """
+        Moves streamed messages into the view on the UI thread.
+        """
+        if cancel.is_set():
+            return
+        while True:
+            try:
+                kind, payload = stream_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'messages':
+                # The view shares the conversation_data list, so this also extends current_data
+                self.conversation_view.extend(payload)
+            elif kind == 'done':
+                self.active_stream = None
+                header, self.current_features, replies = payload
+                header.pop('conversation_data', None)
+                self.current_data.update(header)
+                print(f"Finished streaming {len(self.current_data['conversation_data'])} messages.")
+                self.suggest_response_type(replies)
+                self.show_response_times()
+                self.show_pending_highlight()
+                return
+            else:
+                self.active_stream = None
+                if isinstance(payload, json.JSONDecodeError):
+                    messagebox.showerror("JSON Error", f"Failed to load conversation due to JSON error: {str(payload)}")
+                    print(f"JSON error: {str(payload)}")
+                else:
+                    messagebox.showerror("Error", f"Failed to load conversation: {str(payload)}")
+                    print(f"Error loading conversation: {str(payload)}")
+                self.next_conversation()
+                return
+        self.root.after(20, self.poll_stream, stream_queue, cancel)
+
+    def cancel_stream(self):
+        """
+        Stops parsing a streamed conversation that is no longer shown.
+        """
+        if self.active_stream is not None:
+            self.active_stream.set()
+            self.active_stream = None
+
+    @metrics.track('display_conversation')
+    def display_conversation(self):
+        """
+        Displays the conversation in the scrollable text widget with colored message bubbles.
+        Long threads are rendered in chunks as the user scrolls.
+        """
         if self.current_data and 'conversation_data' in self.current_data:
-            for msg in self.current_data['conversation_data']:
-                timestamp = msg.get('timestamp', 'No Timestamp')
-                sender = msg.get('sender', 'No Sender')
-                message = msg.get('message', 'No Message')
-
-                # Assign a color to the sender if not already assigned
-                if sender not in self.sender_colors:
-                    if self.next_color_index < len(self.available_colors):
-                        self.sender_colors[sender] = self.available_colors[self.next_color_index]
-                        self.next_color_index += 1
-                    else:
-                        # Default color if all predefined colors are used
-                        self.sender_colors[sender] = '#FFFFFF'
-
-                color = self.sender_colors[sender]
-
-                # Create a unique tag for the sender
-                tag_name = f"sender_{sender}"
-                self.conversation_text.tag_configure(tag_name, background=color, lmargin1=5, lmargin2=5, rmargin=5, spacing1=5, spacing3=5, wrap='word')
-
-                # Insert the message with the tag
-                formatted_message = f"{timestamp} - {sender}:\n{message}\n\n"
-                self.conversation_text.insert(tk.END, formatted_message, tag_name)
-
-            self.conversation_text.configure(state='disabled')
+            self.conversation_view.show(self.current_data['conversation_data'])
         else:
+            self.conversation_view.show([])
             print("No messages found in the current data.")
 
-    def save_current(self):
+    @metrics.track('response_times')
+    def show_response_times(self):
         """
-        Saves the current conversation's labeled data to the Excel file.
-        """
-        if not self.current_data:
-            return
+        Shows the first-response time, median reply gap and turn counts of the current conversation.
 
+        They come from the feature index; conversations not indexed yet are
+        measured here once they are fully loaded.
+        """
         conversation_id = self.json_files[self.current_file_index].stem
+        try:
+            times = self.store.response_times(conversation_id)
+        except Exception as e:
+            print(f"Error reading response times: {str(e)}")
+            times = None
+        if times is None:
+            if self.active_stream is not None or not self.current_data:
+                self.response_times_var.set("")
+                return
+            times = self.current_features or conversation_features(self.current_data)
+        self.response_times_var.set(
+            f"First response: {format_duration(times['first_response_seconds'])}   "
+            f"Median reply gap: {format_duration(times['median_reply_gap_seconds'])}   "
+            f"Turns: {times['lead_turns']} lead / {times['responder_turns']} responder"
+        )
+
+    def suggest_response_type(self, replies=None, max_replies=200):
+        """
+        Looks up the shown conversation's replies in the template index in the background.
 
-        # Load existing data
+        Only the first max_replies replies are looked up (a streamed
+        conversation passes the ones it kept); the result is applied by
+        poll_template_lookup once it is ready.
+        """
+        data = self.current_data
+        if replies is None:
+            replies = responder_messages(data)[:max_replies]
+        self.suggestion_var.set("")
+        if not replies:
+            return
+        future = self.template_lookups.submit(self.count_templated, [msg.get('message') for msg in replies])
+        self.root.after(20, self.poll_template_lookup, future, data, replies)
+
+    @metrics.track('template_lookup')
+    def count_templated(self, texts):
+        """
+        Runs on the template lookup thread; returns how many of texts match corpus templates.
+        """
         try:
-            df = pd.read_excel(self.output_file)
+            if self.templates is None:
+                self.templates = TemplateIndex(self.store_file, journal_mode=self.store_options.get('journal_mode', "WAL"))
+            return sum(1 for text in texts if self.templates.is_templated(text))
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to read the output file: {str(e)}")
+            # The index is only a hint; labeling goes on without it
+            print(f"Error looking up templates: {str(e)}")
+            return 0
+
+    def close_templates(self):
+        """
+        Runs on the template lookup thread, which owns the index connection.
+        """
+        if self.templates is not None:
+            self.templates.close()
+            self.templates = None
+
+    def poll_template_lookup(self, future, data, replies):
+        """
+        Pre-selects "Templated" for the active segments when enough replies match corpus templates.
+
+        Only empty response types of a conversation without saved labels are
+        filled in, and only if it is still the one shown. Replies marked
+        is_automated are reported as well.
+        """
+        if not future.done():
+            self.root.after(20, self.poll_template_lookup, future, data, replies)
+            return
+        if data is not self.current_data:
+            return
+        templated = future.result()
+        automated = sum(1 for msg in replies if msg.get('is_automated'))
+
+        hints = []
+        if templated:
+            share = templated / len(replies)
+            # A conversation labeled before keeps what was saved
+            if share >= self.templated_share and self.json_files[self.current_file_index].stem not in self.saved_labels:
+                for segment in self.segments[:self.segment_mode_var.get()]:
+                    row = self.metric_rows[segment].get('response_type')
+                    if row is not None and "Templated" in row.metric.values and row.get() is None:
+                        row.set("Templated")
+                hints.append(f"Suggested Templated: {templated} of {len(replies)} replies match templates seen across the corpus.")
+            else:
+                hints.append(f"{templated} of {len(replies)} replies match templates seen across the corpus.")
+        if automated:
+            hints.append(f"{automated} of {len(replies)} replies are marked automated.")
+        self.suggestion_var.set(" ".join(hints))
+
+    @metrics.track('save_current')
+    def save_current(self):
+        """
+        Saves the current conversation's labeled data to the label store.
+        """
+        if not self.current_data:
+            return
+        if self.active_stream is not None:
+            # Derived columns need the whole conversation
+            self.show_notification("Conversation is still loading, please save again in a moment.")
             return
 
-        # Remove existing entries for this conversation to prevent duplicates
-        df = df[df['conversation_id'] != conversation_id]
+        conversation_id = self.json_files[self.current_file_index].stem
+        features = self.current_features or conversation_features(self.current_data)
 
-        # Create new rows for each segment with filled data
+        # Create new rows for each active segment with filled data
         new_rows = []
-        for segment in self.segments:
-            mode = self.segment_mode_var.get()
-            segment_index = self.segments.index(segment) + 1
-            if segment_index > mode:
-                continue
-
-            sentiment = self.segment_vars[f"{segment}_sentiment_var"].get()
-            engagement = self.segment_vars[f"{segment}_engagement_var"].get()
-            customer_effort = self.segment_vars[f"{segment}_ces_var"].get()
-            response_type = self.segment_vars[f"{segment}_response_type_var"].get()
-
-            new_row = {
-                'conversation_id': conversation_id,
-                'segment': segment,
-                'sentiment': sentiment if sentiment != 0 else None,
-                'engagement_score': engagement if engagement != 0 else None,
-                'customer_effort_score': customer_effort if customer_effort != 0 else None,
-                'response_type': response_type if response_type != '' else None,
-                # Add other fields as needed
-            }
+        for segment in self.segments[:self.segment_mode_var.get()]:
+            new_row = {'conversation_id': conversation_id, 'segment': segment}
+            for row in self.metric_rows[segment].values():
+                new_row[row.metric.column] = row.get()  # None when nothing is selected
+            new_row.update(features)
             new_rows.append(new_row)
 
         if new_rows:
-            df = pd.concat([df, pd.DataFrame(new_rows)], ignore_index=True)
-            try:
-                df.to_excel(self.output_file, index=False)
-                print("Saved data successfully.")
+            # Replaces any earlier labels of this conversation to prevent duplicates
+            items = [(conversation_id, new_rows)]
+            group = self.duplicates.get(conversation_id) if self.dedup_var.get() else None
+            for member in group or []:
+                if member != conversation_id:
+                    # Members' length columns come from their own feature rows on export
+                    items.append((member, [{**row, **dict.fromkeys(features), 'conversation_id': member} for row in new_rows]))
+            self.writer.submit_many(items)
+            self.labeled_ids.update(member for member, _ in items)
+            for member, rows in items:
+                self.saved_labels[member] = {
+                    row['segment']: tuple(row.get(column) for column in self.label_positions) for row in rows
+                }
+            print("Saved data successfully.")
+            if len(items) > 1:
+                self.show_notification(f"Data saved for this conversation and {len(items) - 1} duplicates.")
+            else:
                 self.show_notification("Data saved successfully.")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to save data: {str(e)}")
+
+    def report_save_error(self, error):
+        """
+        Called from the writer thread when a save fails; reports it on the UI thread.
+        """
+        self.root.after(0, self.show_save_error, error)
+
+    def show_save_error(self, error):
+        print(f"Error saving data: {str(error)}")
+        self.show_notification("Saving failed, retrying...")
+        messagebox.showerror("Error", f"Failed to save data: {str(error)}\nSaves will be retried automatically.")
+
+    def export_labels(self):
+        """
+        Exports all stored labels to the Excel output file.
+        """
+        if not self.writer.flush(timeout=30):
+            messagebox.showerror("Error", "Recent labels could not be saved yet, so the export was not written. Please try again.")
+            return
+        try:
+            rows = self.store.export_excel(self.output_file)
+            print(f"Exported {rows} labeled rows to {self.output_file}")
+            self.show_notification(f"Exported {rows} rows to {self.output_file}.")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to export labels: {str(e)}")
+
+    def export_columnar(self, suffix):
+        """
+        Streams all stored labels to labeled_conversations.csv or .parquet on a worker thread.
+        """
+        if not self.writer.flush(timeout=30):
+            messagebox.showerror("Error", "Recent labels could not be saved yet, so the export was not written. Please try again.")
+            return
+        output_file = Path(self.output_file).with_suffix(suffix)
+        threading.Thread(target=self.run_export, args=(output_file,), daemon=True).start()
+        self.show_notification(f"Exporting to {output_file}...")
+
+    def run_export(self, output_file):
+        """
+        Runs on the worker thread with its own connection; reports back on the UI thread.
+        """
+        export_store = LabelStore(self.store_file, **self.store_options)
+        try:
+            start = time.perf_counter()
+            if output_file.suffix == ".parquet":
+                rows = export_store.export_parquet(output_file)
+            else:
+                rows = export_store.export_csv(output_file)
+            metrics.record('export_columnar', time.perf_counter() - start)
+            print(f"Exported {rows} labeled rows to {output_file}")
+            self.root.after(0, self.show_notification, f"Exported {rows} rows to {output_file}.")
+        except Exception as e:
+            self.root.after(0, messagebox.showerror, "Error", f"Failed to export labels: {str(e)}")
+        finally:
+            export_store.close()
+
+    def open_dashboard(self):
+        """
+        Opens (or raises) the window with per-segment label statistics.
+        """
+        if self.dashboard is not None and self.dashboard.winfo_exists():
+            self.dashboard.lift()
+            return
+        self.dashboard = tk.Toplevel(self.root)
+        self.dashboard.title("Label Dashboard")
+        button_frame = tk.Frame(self.dashboard)
+        button_frame.pack(fill="x", padx=10, pady=(10, 0))
+        tk.Button(button_frame, text="Export CSV", command=lambda: self.export_columnar(".csv")).pack(side=tk.LEFT, padx=(0, 5))
+        tk.Button(button_frame, text="Export Parquet", command=lambda: self.export_columnar(".parquet")).pack(side=tk.LEFT)
+        self.dashboard_text = tk.Text(self.dashboard, width=100, height=30, font=('Consolas', 10), state='disabled')
+        self.dashboard_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.refresh_dashboard()
+
+    @metrics.track('dashboard_refresh')
+    def refresh_dashboard(self):
+        """
+        Redraws the dashboard from the label rollups every two seconds while it is open.
+        """
+        if self.dashboard is None or not self.dashboard.winfo_exists():
+            self.dashboard = None
+            return
+        labels = {metric.column: metric.label for metric in self.schema.metrics}
+        rollups = self.store.rollups()
+        lines = []
+        for segment in self.segments:
+            lines.append(segment)
+            for column, label in labels.items():
+                stats = rollups.get(segment, {}).get(column)
+                if not stats:
+                    lines.append(f"  {label:<26}{'n=0':>8}")
+                    continue
+                if stats['mean'] is not None:
+                    distribution = "  ".join(f"{value}:{count}" for value, count in sorted(stats['distribution'].items()))
+                    lines.append(f"  {label:<26}{'n=' + str(stats['count']):>8}  mean {stats['mean']:.2f}   {distribution}")
+                else:
+                    mix = "  ".join(f"{value} {count / stats['count']:.0%}" for value, count in stats['distribution'].items())
+                    lines.append(f"  {label:<26}{'n=' + str(stats['count']):>8}  {mix}")
+            lines.append("")
+        self.dashboard_text.configure(state='normal')
+        self.dashboard_text.delete('1.0', tk.END)
+        self.dashboard_text.insert(tk.END, "\n".join(lines))
+        self.dashboard_text.configure(state='disabled')
+        self.root.after(2000, self.refresh_dashboard)
 
     def save_and_next(self):
         """
         Saves the current conversation's labeled data and moves to the next conversation.
         """
+        if self.active_stream is not None:
+            # Stay on the conversation until it can be saved
+            self.show_notification("Conversation is still loading, please save again in a moment.")
+            return
         self.save_current()
         self.next_conversation()
 
@@ -520,29 +1346,160 @@ class ConversationLabeler:
         """
         if messagebox.askyesno("Skip Conversation", "Are you sure you want to skip this conversation?"):
             self.show_notification("Conversation skipped.")
+            if self.work_queue is not None and self.current_file_index < len(self.json_files):
+                # Hand it to another annotator
+                self.work_queue.release([self.json_files[self.current_file_index].stem], skipped=True)
             self.next_conversation()
 
     def next_conversation(self):
         """
-        Moves to the next conversation in the list.
+        Moves to the next conversation in the list, or the next leased one with a shared queue.
         """
-        self.current_file_index += 1
+        if self.work_queue is not None:
+            index = self.next_leased_index()
+            self.current_file_index = len(self.json_files) if index is None else index
+        else:
+            self.current_file_index += 1
+            if self.hide_labeled_var.get():
+                self.current_file_index = self.first_unlabeled(self.current_file_index)
         self.clear_form()
-        if self.current_file_index >= len(self.json_files):
+        if self.current_file_index >= len(self.json_files) and (self.scanning or self.watch):
+            # Caught up with discovery; poll_scan or poll_watch loads it once it is listed
+            self.waiting_for_files = True
+            self.current_data = None
+            self.show_notification("Discovering more conversations..." if self.scanning else "Waiting for new conversations...")
+        elif self.current_file_index >= len(self.json_files):
             messagebox.showinfo("Complete", "All conversations have been processed!")
             self.root.quit()
         else:
             self.load_conversation()
 
+    def remember(self, path):
+        """
+        Adds a conversation to the session history unless it is the current history entry.
+        """
+        if self.history and self.history[self.history_pos] == path:
+            return
+        # Like a browser: opening a conversation drops the entries ahead of the current one
+        del self.history[self.history_pos + 1:]
+        self.history.append(path)
+        self.history_pos = len(self.history) - 1
+
+    def queue_position(self, path):
+        """
+        Returns the index of a conversation in the queue, or None if it is not in it.
+        """
+        if self.json_files is self.all_files:
+            return self.file_index.get(path.stem)
+        try:
+            return self.json_files.index(path)
+        except ValueError:
+            return None
+
+    def open_conversation(self, index):
+        """
+        Shows the conversation at a queue position without saving the current one.
+        """
+        self.cancel_stream()
+        self.waiting_for_files = False
+        self.current_file_index = index
+        self.load_conversation()
+
+    def go_history(self, step):
+        """
+        Moves back (step -1) or forward (step 1) through the conversations opened this session.
+        """
+        position = self.history_pos + step
+        while 0 <= position < len(self.history):
+            index = self.queue_position(self.history[position])
+            if index is not None:
+                self.history_pos = position
+                self.open_conversation(index)
+                return
+            # Filtered out or deleted since it was opened
+            position += step
+        self.show_notification("No earlier conversation in this session." if step < 0 else "No later conversation in this session.")
+
+    def go_to(self):
+        """
+        Opens the conversation whose number is typed into the Go to field.
+        """
+        if self.work_queue is not None:
+            self.show_notification("Go to is not available with a shared queue; use Back and Forward.")
+            return
+        try:
+            number = int(self.goto_var.get())
+        except ValueError:
+            messagebox.showerror("Invalid Number", "Enter the number of a conversation, e.g. 42.")
+            return
+        if not 1 <= number <= len(self.json_files):
+            messagebox.showerror("Invalid Number", f"Enter a number between 1 and {len(self.json_files)}.")
+            return
+        self.goto_var.set("")
+        # Give the keyboard back to the shortcuts
+        self.root.focus_set()
+        self.open_conversation(number - 1)
+
+    @metrics.track('restore_labels')
+    def restore_labels(self, conversation_id):
+        """
+        Fills the active segments with the labels saved for a conversation, or clears them.
+        """
+        saved = self.saved_labels.get(conversation_id, {})
+        for segment in self.segments[:self.segment_mode_var.get()]:
+            values = saved.get(segment)
+            for row in self.metric_rows[segment].values():
+                row.set(None if values is None else values[self.label_positions[row.metric.column]])
+
+    def next_leased_index(self):
+        """
+        Returns the index of the next conversation leased from the shared queue.
+
+        Leases a new batch when the local one is used up. Returns None when
+        nothing is available to this annotator right now.
+        """
+        unknown = []
+        try:
+            while True:
+                while self.leased:
+                    conversation_id = self.leased.popleft()
+                    if conversation_id in self.file_index:
+                        return self.file_index[conversation_id]
+                    # Registered by another annotator but not discovered here yet
+                    unknown.append(conversation_id)
+                batch = self.work_queue.lease()
+                batch = [conversation_id for conversation_id in batch if conversation_id not in unknown]
+                if not batch:
+                    return None
+                self.leased.extend(batch)
+        except Exception as e:
+            print(f"Error leasing conversations: {str(e)}")
+            self.show_notification("Shared queue is busy, retrying...")
+            return None
+        finally:
+            if unknown:
+                self.work_queue.release(unknown)
+
+    def heartbeat_leases(self):
+        """
+        Runs on a worker thread and keeps this annotator's leases from expiring.
+        """
+        heartbeat_queue = WorkQueue(self.store_file, owner=self.work_queue.owner)
+        while not self.stop_heartbeat.wait(heartbeat_queue.lease_seconds / 3):
+            try:
+                heartbeat_queue.heartbeat()
+            except Exception as e:
+                print(f"Error renewing leases: {str(e)}")
+        heartbeat_queue.close()
+
+    @metrics.track('clear_form')
     def clear_form(self):
         """
         Clears all input fields for each segment.
         """
-        for segment in self.segments:
-            self.segment_vars[f"{segment}_sentiment_var"].set(0)  # Reset to no selection
-            self.segment_vars[f"{segment}_engagement_var"].set(0)  # Reset to no selection
-            self.segment_vars[f"{segment}_ces_var"].set(0)  # Reset customer effort to no selection
-            self.segment_vars[f"{segment}_response_type_var"].set("")  # Reset response type to no selection
+        for rows in self.metric_rows.values():
+            for row in rows.values():
+                row.clear()  # No-op for rows that are already empty
 
     def update_progress_label(self):
         """
@@ -563,6 +1520,54 @@ class ConversationLabeler:
         else:
             self.progress_bar['value'] = 0
 
+    def on_close(self):
+        """
+        Ends the main loop when the window is closed; cleanup happens in shutdown().
+        """
+        self.root.quit()
+
+    def toggle_metrics_overlay(self, force=None):
+        """
+        Shows or hides the on-screen latency percentiles.
+        """
+        self.show_metrics = (not self.show_metrics) if force is None else force
+        if self.show_metrics:
+            self.metrics_label.place(relx=1.0, rely=1.0, anchor='se')
+            self.metrics_label.lift()
+            self.refresh_metrics_overlay()
+        else:
+            self.metrics_label.place_forget()
+
+    def refresh_metrics_overlay(self):
+        if not self.show_metrics:
+            return
+        self.metrics_label.config(text=metrics.format_table())
+        self.root.after(1000, self.refresh_metrics_overlay)
+
+    def shutdown(self):
+        """
+        Commits and syncs queued saves and stops background work.
+        """
+        if self.metrics_file:
+            metrics.export(self.metrics_file)
+        self.cancel_stream()
+        self.stop_watch.set()
+        self.stop_index.set()
+        self.writer.close()
+        if self.work_queue is not None:
+            # Labels are committed by now; everything else goes back to the pool
+            self.stop_heartbeat.set()
+            self.work_queue.release()
+            self.work_queue.close()
+        self.prefetcher.shutdown()
+        for shard in self.shards:
+            shard.close()
+        # The lookup thread owns the template index connection
+        self.template_lookups.submit(self.close_templates)
+        self.template_lookups.shutdown(wait=True)
+        self.search_index.close()
+        self.store.close()
+
     def show_notification(self, message, duration=2):
         """
         Displays a transient notification that disappears after a specified duration.
@@ -580,7 +1585,82 @@ class ConversationLabeler:
 
         threading.Thread(target=hide_notification, daemon=True).start()
 
-if __name__ == "__main__":
+def main():
+    parser = argparse.ArgumentParser(description="Label conversations, or pre-compute their features without a window.")
+    parser.add_argument('--corpus', metavar='PATH', help="Conversations directory or shard to label (prompted for if omitted)")
+    parser.add_argument('--featurize', metavar='DIR', help="Compute message lengths, counts and response times for every conversation in DIR and exit")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes for --featurize (default: all cores)")
+    parser.add_argument('--force', action='store_true', help="With --featurize, recompute files that have not changed")
+    parser.add_argument('--metrics-file', default="labeler_metrics.jsonl", help="Where latency percentiles are appended on exit")
+    parser.add_argument('--show-metrics', action='store_true', help="Start with the latency overlay visible (toggle with F12)")
+    parser.add_argument('--shared-queue', metavar='DB', help="SQLite file on a shared disk through which several annotators split the work and store labels")
+    parser.add_argument('--profile', action='store_true', help="Capture a cProfile profile and tracemalloc snapshot for this session")
+    parser.add_argument('--schema', metavar='FILE', help="Label schema with the segments and metrics to label (default: label_schema.json)")
+    parser.add_argument('--watch', action='store_true', help="Keep watching the conversations directory and queue files added while labeling")
+    parser.add_argument('--watch-interval', type=float, default=2.0, metavar='SECONDS', help="How often --watch checks the directory without file system events (default: 2)")
+    parser.add_argument('--templated-share', type=float, default=0.5, metavar='SHARE',
+                        help="Share of a conversation's replies that must match corpus templates to suggest Templated (default: 0.5)")
+    parser.add_argument('--dedup-ignore-digits', action='store_true',
+                        help="Also treat conversations that differ only in numbers (order ids, prices) as duplicates")
+    parser.add_argument('--export', metavar='FILE', help="Write all stored labels to FILE (.csv, .parquet or .xlsx) and exit")
+    parser.add_argument('--db', metavar='FILE',
+                        help="Label database read by --export and written by --featurize (default: the --shared-queue file, else labeled_conversations.db)")
+    args = parser.parse_args()
+
+    try:
+        schema = load_schema(args.schema)
+    except ValueError as e:
+        parser.error(str(e))
+    if not 0 < args.templated_share <= 1:
+        parser.error("--templated-share must be greater than 0 and at most 1")
+
+    # A shared queue database is on a network disk, where WAL does not work
+    db_file = args.db or args.shared_queue or "labeled_conversations.db"
+    db_options = {'journal_mode': "DELETE"} if args.shared_queue and not args.db else {}
+
+    if args.export:
+        suffix = Path(args.export).suffix.lower()
+        if suffix not in (".csv", ".parquet", ".xlsx"):
+            parser.error(f"--export needs a .csv, .parquet or .xlsx file, not {args.export}")
+        store = LabelStore(db_file, metric_columns=[metric.column for metric in schema.metrics], **db_options)
+        try:
+            if suffix == ".parquet":
+                rows = store.export_parquet(args.export)
+            elif suffix == ".xlsx":
+                rows = store.export_excel(args.export)
+            else:
+                rows = store.export_csv(args.export)
+        except (RuntimeError, ImportError) as e:
+            # pyarrow, pandas or openpyxl is missing
+            parser.error(f"cannot export to {args.export}: {str(e)}")
+        finally:
+            store.close()
+        print(f"Exported {rows} labeled rows to {args.export}")
+        return
+
+    if args.featurize:
+        store = LabelStore(db_file, **db_options)
+        featurized, skipped, failed = featurize_corpus(args.featurize, store, workers=args.workers, force=args.force)
+        store.close()
+        print(f"Featurized {featurized} conversations, skipped {skipped} unchanged, {failed} failed.")
+        return
+
+    profiler = None
+    if args.profile:
+        profiler = SessionProfiler(f"labeler_profile_{time.strftime('%Y%m%d_%H%M%S')}")
+        profiler.start()
+
     root = tk.Tk()
-    app = ConversationLabeler(root)
+    app = ConversationLabeler(root, corpus_path=args.corpus, metrics_file=args.metrics_file, show_metrics=args.show_metrics,
+                              shared_queue=args.shared_queue, schema=schema,
+                              watch=args.watch, watch_interval=args.watch_interval, templated_share=args.templated_share,
+                              dedup_ignore_digits=args.dedup_ignore_digits)
     root.mainloop()
+    app.shutdown()
+    root.destroy()
+
+    if profiler is not None:
+        profiler.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import tkinter as tk
+
+
+class ConversationView:
+    """
+    Windowed renderer for the conversation text widget.
+
+    Only the first chunk of messages is inserted when a conversation is shown;
+    further chunks are appended as the user scrolls towards the end. Sender tags
+    are configured once and reused across conversations, and very long messages
+    are collapsed behind a clickable "show more" link. messages may be a list
+    or a parsing.RawMessages, whose messages are decoded as they are rendered.
+    """
+
+    def __init__(self, text, available_colors, chunk_size=50, load_threshold=0.8, collapse_chars=2000):
+        self.text = text
+        self.chunk_size = chunk_size
+        self.load_threshold = load_threshold
+        self.collapse_chars = collapse_chars
+
+        self.messages = []
+        self.rendered = 0
+        self.load_pending = False
+        # mark name -> (message index, hidden remainder, sender tag)
+        self.collapsed = {}
+
+        # Senders get palette colors in order of appearance, then the default color
+        self.sender_tags = {}
+        self.palette_tags = []
+        for idx, color in enumerate(available_colors):
+            tag_name = f"sender_{idx}"
+            self.text.tag_configure(tag_name, background=color, lmargin1=5, lmargin2=5, rmargin=5, spacing1=5, spacing3=5, wrap='word')
+            self.palette_tags.append(tag_name)
+        self.text.tag_configure("sender_default", background='#FFFFFF', lmargin1=5, lmargin2=5, rmargin=5, spacing1=5, spacing3=5, wrap='word')
+        self.text.tag_configure("show_more", foreground='#1A5FB4', underline=True)
+        self.text.tag_raise("show_more")
+        # Search hits: the matching message is outlined and the matched words marked
+        self.text.tag_configure("search_hit", borderwidth=2, relief='solid')
+        self.text.tag_configure("search_term", background='#FFE45C')
+        self.text.tag_raise("search_term")
+        self.text.tag_bind("show_more", "<Button-1>", self.expand_at)
+        self.text.tag_bind("show_more", "<Enter>", lambda event: self.text.configure(cursor='hand2'))
+        self.text.tag_bind("show_more", "<Leave>", lambda event: self.text.configure(cursor=''))
+
+        # Watch the scroll position to load more messages near the end
+        self.scroll_command = self.text.cget('yscrollcommand')
+        self.text.configure(yscrollcommand=self.on_scroll)
+
+    def tag_for(self, sender):
+        """
+        Returns the tag of a sender, assigning the next palette color if needed.
+        """
+        if sender not in self.sender_tags:
+            if len(self.sender_tags) < len(self.palette_tags):
+                self.sender_tags[sender] = self.palette_tags[len(self.sender_tags)]
+            else:
+                # Default color if all predefined colors are used
+                self.sender_tags[sender] = "sender_default"
+        return self.sender_tags[sender]
+
+    def show(self, messages):
+        """
+        Replaces the displayed conversation and renders its first chunk.
+        """
+        self.text.configure(state='normal')
+        self.text.delete('1.0', tk.END)
+        for mark in self.collapsed:
+            self.text.mark_unset(mark)
+        self.collapsed = {}
+        for idx in range(self.rendered):
+            self.text.mark_unset(f"message_{idx}")
+        self.text.configure(state='disabled')
+
+        self.messages = messages
+        self.rendered = 0
+        self.render_more()
+        self.text.yview_moveto(0)
+
+    def extend(self, messages):
+        """
+        Appends messages to the displayed conversation, e.g. while still parsing.
+        """
+        self.messages.extend(messages)
+        self.schedule_load()
+
+    def render_more(self):
+        """
+        Inserts the next chunk of messages at the end of the text widget.
+        """
+        self.load_pending = False
+        end = min(self.rendered + self.chunk_size, len(self.messages))
+        if end <= self.rendered:
+            return
+
+        self.text.configure(state='normal')
+        # A streamed conversation (RawMessages) decodes only this chunk
+        for idx, msg in enumerate(self.messages[self.rendered:end], start=self.rendered):
+            timestamp = msg.get('timestamp', 'No Timestamp')
+            sender = msg.get('sender', 'No Sender')
+            message = msg.get('message', 'No Message')
+            tag_name = self.tag_for(sender)
+            # Start of the message, for scrolling to it later
+            self.text.mark_set(f"message_{idx}", tk.END + '-1c')
+            self.text.mark_gravity(f"message_{idx}", tk.LEFT)
+
+            if isinstance(message, str) and len(message) > self.collapse_chars:
+                hidden = message[self.collapse_chars:]
+                self.text.insert(tk.END, f"{timestamp} - {sender}:\n{message[:self.collapse_chars]}", tag_name)
+                mark = f"collapsed_{idx}"
+                self.text.mark_set(mark, tk.END + '-1c')
+                self.text.mark_gravity(mark, tk.LEFT)
+                self.collapsed[mark] = (idx, hidden, tag_name)
+                self.text.insert(tk.END, f" … [show {len(hidden)} more characters]", (tag_name, "show_more"))
+                self.text.insert(tk.END, "\n\n", tag_name)
+            else:
+                self.text.insert(tk.END, f"{timestamp} - {sender}:\n{message}\n\n", tag_name)
+        self.text.configure(state='disabled')
+        self.rendered = end
+
+    def highlight(self, idx, terms=()):
+        """
+        Scrolls to message idx, rendering the chunks before it, and marks it and the given terms.
+        """
+        while self.rendered <= idx < len(self.messages):
+            self.render_more()
+        if idx >= self.rendered:
+            return
+        start = f"message_{idx}"
+        end = f"message_{idx + 1}" if idx + 1 < self.rendered else tk.END
+        self.text.tag_remove("search_hit", '1.0', tk.END)
+        self.text.tag_remove("search_term", '1.0', tk.END)
+        self.text.tag_add("search_hit", start, end)
+        for term in terms:
+            position = start
+            while True:
+                count = tk.IntVar()
+                position = self.text.search(term, position, stopindex=end, nocase=True, count=count)
+                if not position or not count.get():
+                    break
+                self.text.tag_add("search_term", position, f"{position}+{count.get()}c")
+                position = f"{position}+{count.get()}c"
+        self.text.see(end)
+        self.text.see(start)
+
+    def schedule_load(self):
+        if not self.load_pending and self.rendered < len(self.messages):
+            self.load_pending = True
+            self.text.after_idle(self.render_more)
+
+    def on_scroll(self, first, last):
+        """
+        Forwards scroll updates to the scrollbar and loads more near the end.
+        """
+        if self.scroll_command:
+            self.text.tk.call(self.scroll_command, first, last)
+        if float(last) >= self.load_threshold:
+            self.schedule_load()
+
+    def expand_at(self, event):
+        """
+        Expands the collapsed message whose "show more" link was clicked.
+        """
+        index = self.text.index(f"@{event.x},{event.y}")
+        link = self.text.tag_prevrange("show_more", index + '+1c')
+        if not link:
+            return
+        for mark, (idx, hidden, tag_name) in self.collapsed.items():
+            if self.text.compare(mark, '==', link[0]):
+                self.text.configure(state='normal')
+                self.text.delete(link[0], link[1])
+                self.text.insert(link[0], hidden, tag_name)
+                self.text.configure(state='disabled')
+                self.text.mark_unset(mark)
+                del self.collapsed[mark]
+                break
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from archives import GZIP_SUFFIX, GzipFileEntry, is_gzip_file
+
+# Manifest written next to the conversations directory, as ".<dir name><suffix>".
+# It lives outside the directory so that writing it does not touch the directory mtime.
+MANIFEST_SUFFIX = ".meta_labeler_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def content_hash(path, chunk_size=1024 * 1024):
+    """
+    Returns a hex digest of the file contents.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CorpusScanner:
+    """
+    Discovers conversation files in a directory incrementally.
+
+    Files are listed with os.scandir, in name order, and handed out in batches
+    so the first conversation can be shown before every file has been stat'ed. A manifest of
+    (name, size, mtime, content hash) is kept next to the corpus; on later
+    starts only new or modified files are hashed again, and an unchanged
+    directory is not listed at all. Gzipped files are handed out as
+    GzipFileEntry.
+    """
+
+    def __init__(self, root_dir, suffix=(".json", GZIP_SUFFIX), batch_size=500):
+        self.root_dir = Path(root_dir)
+        self.suffix = suffix
+        self.batch_size = batch_size
+        self.manifest_file = self.root_dir.parent / f".{self.root_dir.name}{MANIFEST_SUFFIX}"
+        # name -> {"size", "mtime", "hash"}, in queue order
+        self.entries = {}
+        self.removed = []
+        self.dir_mtime = None
+
+    def load_manifest(self):
+        """
+        Returns the stored manifest, or None if it is missing or unreadable.
+        """
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('version') != MANIFEST_VERSION:
+            return None
+        return manifest
+
+    def save_manifest(self, dir_mtime):
+        """
+        Writes the manifest atomically via a temporary file.
+        """
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'dir_mtime': dir_mtime,
+            'entries': [
+                [name, entry['size'], entry['mtime'], entry['hash']]
+                for name, entry in self.entries.items()
+            ],
+        }
+        tmp_file = self.manifest_file.with_name(self.manifest_file.name + ".tmp")
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, separators=(',', ':'))
+            os.replace(tmp_file, self.manifest_file)
+        except OSError as e:
+            # A read-only corpus still works, it is just rescanned next time
+            print(f"Could not write manifest: {str(e)}")
+
+    def entry(self, name):
+        """
+        Returns the queue entry for a file name in the directory.
+        """
+        if is_gzip_file(name):
+            return GzipFileEntry(self.root_dir / name)
+        return self.root_dir / name
+
+    def _iter_files(self):
+        with os.scandir(self.root_dir) as it:
+            for entry in it:
+                if entry.name.endswith(self.suffix) and entry.is_file():
+                    yield entry
+
+    def scan(self, trust_dir_mtime=True):
+        """
+        Yields lists of queue entries (paths) in queue order as they are discovered.
+
+        Once every batch has been handed out, files that are new or changed
+        since the last run are hashed and the manifest is rewritten.
+
+        Args:
+            trust_dir_mtime (bool): Reuse the stored listing when the directory
+                mtime is unchanged. Edits to existing files do not change the
+                directory mtime, so pass False when every hash must be current.
+        """
+        manifest = self.load_manifest()
+        known = {}
+        if manifest:
+            known = {
+                name: {'size': size, 'mtime': mtime, 'hash': digest}
+                for name, size, mtime, digest in manifest['entries']
+            }
+        dir_mtime = os.stat(self.root_dir).st_mtime_ns
+        self.dir_mtime = dir_mtime
+
+        if trust_dir_mtime and manifest and manifest['dir_mtime'] == dir_mtime:
+            # Nothing was added, removed or renamed: reuse the stored listing as-is
+            # Manifests written before the listing was sorted as a whole are put in order
+            names = sorted(known)
+            self.entries = {name: known[name] for name in names}
+            for start in range(0, len(names), self.batch_size):
+                yield [self.entry(name) for name in names[start:start + self.batch_size]]
+            return
+
+        self.entries = {}
+        batch = []
+        # Names are cheap to list; the whole listing is sorted so the queue order
+        # is the same on every run, and only the stat calls are spread over batches
+        for name in sorted(entry.name for entry in self._iter_files()):
+            try:
+                stat = os.stat(self.root_dir / name)
+            except OSError:
+                # Removed since it was listed
+                continue
+            previous = known.get(name)
+            unchanged = previous and previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime_ns
+            self.entries[name] = {
+                'size': stat.st_size,
+                'mtime': stat.st_mtime_ns,
+                'hash': previous['hash'] if unchanged else None,
+            }
+            batch.append(name)
+            if len(batch) >= self.batch_size:
+                yield [self.entry(name) for name in batch]
+                batch = []
+        if batch:
+            yield [self.entry(name) for name in batch]
+
+        self.removed = [name for name in known if name not in self.entries]
+        for name, entry in self.entries.items():
+            if entry['hash'] is None:
+                try:
+                    entry['hash'] = content_hash(self.root_dir / name)
+                except OSError:
+                    # Vanished or unreadable since listing; it fails later on load
+                    entry['hash'] = None
+        self.save_manifest(dir_mtime)
+
+    def changes(self, trust_dir_mtime=True):
+        """
+        Brings the entries up to date with the directory after scan() and reports the difference.
+
+        With trust_dir_mtime the directory is only listed again when its mtime
+        moved, which catches added, removed and renamed files for the cost of
+        one stat; pass False to also catch files edited in place. New and
+        changed files are hashed and the manifest is rewritten if anything
+        changed.
+
+        Returns:
+            tuple: (added entries in name order, changed entries, removed names)
+        """
+        dir_mtime = os.stat(self.root_dir).st_mtime_ns
+        if trust_dir_mtime and dir_mtime == self.dir_mtime:
+            return [], [], []
+
+        added, changed = [], []
+        listed = set()
+        for entry in self._iter_files():
+            listed.add(entry.name)
+            stat = entry.stat()
+            previous = self.entries.get(entry.name)
+            if previous and previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime_ns:
+                continue
+            try:
+                digest = content_hash(self.root_dir / entry.name)
+            except OSError:
+                digest = None
+            self.entries[entry.name] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': digest}
+            (changed if previous else added).append(entry.name)
+        removed = [name for name in self.entries if name not in listed]
+        for name in removed:
+            del self.entries[name]
+
+        self.dir_mtime = dir_mtime
+        if added or changed or removed:
+            self.save_manifest(dir_mtime)
+        return [self.entry(name) for name in sorted(added)], [self.entry(name) for name in changed], removed
+
+    def hash_of(self, path):
+        """
+        Returns the content hash recorded for a path or queue entry, if known.
+        """
+        entry = self.entries.get(Path(path).name if isinstance(path, str) else path.name)
+        return entry['hash'] if entry else None
@@ -0,0 +1,420 @@
+import hashlib
+import re
+import statistics
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+from corpus import CorpusScanner
+from parallel import entry_stat, map_entries
+from parsing import loads
+
+# Derived per-conversation columns of the label sheet
+FEATURE_COLUMNS = ['message_sent_length', 'message_received_length', 'total_messages',
+                   'first_response_seconds', 'median_reply_gap_seconds', 'lead_turns', 'responder_turns']
+
+# Further per-conversation columns used to sort and filter the labeling queue
+INDEX_COLUMNS = ['distinct_senders', 'sender_chars', 'automated_share', 'first_timestamp', 'last_timestamp', 'last_activity',
+                 'dedup_key', 'loose_dedup_key']
+
+# Bumped whenever conversation_features() changes, so stored rows are computed again
+FEATURE_INDEX_VERSION = 4
+
+_DIGITS = re.compile(r"\d+")
+
+TIMESTAMP_FORMATS = ("%d %b %Y, %H:%M", "%d %B %Y, %H:%M", "%Y-%m-%dT%H:%M:%SZ", "%Y-%m-%dT%H:%M:%S",
+                     "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M")
+
+# Pattern of each strptime directive TimestampFormat understands
+_DIRECTIVES = {
+    'd': r"(\d{1,2})", 'm': r"(\d{1,2})", 'Y': r"(\d{4})", 'H': r"(\d{1,2})", 'M': r"(\d{2})", 'S': r"(\d{2})",
+    'b': r"([A-Za-z]{3})", 'B': r"([A-Za-z]{3,9})",
+}
+_MONTHS = {name: number for number, name in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], start=1)}
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# Timestamps checked when inferring the format of a batch
+_SAMPLE_SIZE = 50
+# Batches parsed one timestamp at a time after an inference found no format, before trying again
+_INFERENCE_BACKOFF = 100
+# Distinct minutes a TimestampFormat remembers before starting over
+_MINUTE_CACHE_SIZE = 100000
+
+
+def _iso_seconds(text):
+    """
+    Converts an ISO 8601 timestamp to seconds since the epoch (UTC if it has no zone), or None.
+    """
+    try:
+        value = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def timestamp_value(text):
+    """
+    Converts a message timestamp to seconds since the epoch, or None if it cannot be read.
+
+    Timestamps without a time zone are read as UTC, like TimestampFormat does.
+    """
+    if not isinstance(text, str):
+        return None
+    value = _iso_seconds(text)
+    if value is None:
+        # A regular expression rejects unreadable text faster than strptime does
+        for timestamp_format in _FALLBACK_FORMATS:
+            if timestamp_format.matches(text):
+                return timestamp_format.values([text])[0]
+    return value
+
+
+class TimestampFormat:
+    """
+    Parses batches of timestamps that share one of the TIMESTAMP_FORMATS.
+
+    The format is compiled into one multi-line regular expression, so a whole
+    batch is matched in a single pass over the joined text instead of one
+    strptime call per message. Each distinct minute is converted once and
+    cached, leaving one dictionary lookup per timestamp. ISO 8601 formats are
+    read with datetime.fromisoformat instead, which is implemented in C and
+    faster still.
+    """
+
+    def __init__(self, fmt):
+        self.format = fmt
+        self.fields = []
+        pattern = ""
+        for literal, directive in re.findall(r"([^%]*)(?:%(.))?", fmt):
+            pattern += re.escape(literal)
+            if directive:
+                pattern += _DIRECTIVES[directive]
+                self.fields.append(directive)
+        # Lines that do not match produce empty groups, so results stay aligned with the batch
+        self.regex = re.compile(f"^(?:{pattern}|.*)$", re.MULTILINE)
+        self.month_field = 'm' if 'm' in self.fields else ('b' if 'b' in self.fields else 'B')
+        self.iso = fmt.startswith("%Y-%m-%d")
+        self.days = {}
+        # Date and time up to the minute -> seconds since the epoch, or False if invalid
+        self.minutes = {}
+
+    def matches(self, text):
+        match = self.regex.fullmatch(text) if isinstance(text, str) else None
+        return match is not None and match.group(1) is not None
+
+    def minute_value(self, groups):
+        """
+        Returns the seconds since the epoch of the start of the minute in matched groups, or False if invalid.
+        """
+        fields = dict(zip(self.fields, groups))
+        key = (fields['Y'], fields[self.month_field], fields['d'])
+        day = self.days.get(key)
+        if day is None:
+            try:
+                month = int(key[1]) if self.month_field == 'm' else _MONTHS[key[1][:3].lower()]
+                day = (date(int(key[0]), month, int(key[2])).toordinal() - _EPOCH_ORDINAL) * 86400
+            except (KeyError, ValueError):
+                day = False
+            self.days[key] = day
+        hour, minute = int(fields['H']), int(fields['M'])
+        if day is False or hour > 23 or minute > 59:
+            return False
+        return day + hour * 3600 + minute * 60
+
+    def values(self, texts):
+        """
+        Returns seconds since the epoch (as UTC) for each text, None where it does not match.
+        """
+        if self.iso:
+            return [_iso_seconds(text) for text in texts]
+        # Text with line breaks would shift the matches of the rest of the batch
+        lines = [text if isinstance(text, str) and '\n' not in text else '' for text in texts]
+        matches = self.regex.findall("\n".join(lines))
+        if len(matches) != len(lines):
+            return [None] * len(lines)
+        second_idx = self.fields.index('S') if 'S' in self.fields else None
+        minutes = self.minutes
+        if len(minutes) > _MINUTE_CACHE_SIZE:
+            minutes.clear()
+        values = []
+        for groups in matches:
+            if not groups[0]:
+                values.append(None)
+                continue
+            if second_idx is None:
+                key, second = groups, 0
+            else:
+                # Seconds are added on top of the cached start of the minute
+                key, second = groups[:second_idx] + groups[second_idx + 1:], int(groups[second_idx])
+            minute = minutes.get(key)
+            if minute is None:
+                minute = minutes[key] = self.minute_value(groups)
+            values.append(None if minute is False or second > 59 else minute + second)
+        return values
+
+
+_FALLBACK_FORMATS = [TimestampFormat(fmt) for fmt in TIMESTAMP_FORMATS]
+
+
+def infer_timestamp_format(texts):
+    """
+    Returns the TimestampFormat matching most of a sample of texts, or None if none matches.
+    """
+    sample = [text for text in texts if isinstance(text, str) and text][:_SAMPLE_SIZE]
+    best, best_count = None, 0
+    for fmt in TIMESTAMP_FORMATS:
+        candidate = TimestampFormat(fmt)
+        count = sum(1 for text in sample if candidate.matches(text))
+        if count > best_count:
+            best, best_count = candidate, count
+    return best
+
+
+# Inferred on first use in each process and kept while it keeps matching
+_timestamp_format = None
+# Batches left before inferring again after an inference failed
+_skip_inference = 0
+
+
+def _infer(texts):
+    """
+    Infers a format from texts, remembering a failure so it is not retried on every batch.
+    """
+    global _skip_inference
+    if _skip_inference > 0:
+        _skip_inference -= 1
+        return None
+    inferred = infer_timestamp_format(texts)
+    if inferred is None and any(isinstance(text, str) and text for text in texts):
+        _skip_inference = _INFERENCE_BACKOFF
+    return inferred
+
+
+def timestamp_values(texts):
+    """
+    Converts a batch of message timestamps to seconds since the epoch (None if unreadable).
+
+    The format is inferred once and reused for later batches; it is inferred
+    again only when it stops matching most of a batch. Timestamps in no known
+    format (ISO 8601 with a time zone offset, for example) fall back to
+    timestamp_value().
+    """
+    global _timestamp_format
+    if _timestamp_format is None:
+        _timestamp_format = _infer(texts)
+        if _timestamp_format is None:
+            return [timestamp_value(text) for text in texts]
+    values = _timestamp_format.values(texts)
+    missing = [idx for idx, value in enumerate(values) if value is None and texts[idx]]
+    if len(missing) * 2 > len(texts):
+        inferred = _infer([texts[idx] for idx in missing])
+        if inferred is not None and inferred.format != _timestamp_format.format:
+            # The corpus mixes formats; switch to the one this batch uses
+            _timestamp_format = inferred
+            values = _timestamp_format.values(texts)
+            missing = [idx for idx, value in enumerate(values) if value is None and texts[idx]]
+    for idx in missing:
+        values[idx] = timestamp_value(texts[idx])
+    return values
+
+
+class ConversationFeatures:
+    """
+    Running computation of the conversation_features() columns, fed messages in order.
+
+    Only counters, the reply gaps and a running digest are kept, so a
+    conversation streamed in batches never has to be held in memory as a
+    whole. The sender of the first message is taken to be the lead:
+    characters sent by the lead count as received, characters from everyone
+    else as sent.
+
+    Consecutive messages from the same side (the lead, or anyone else) form one
+    turn. The first response time runs from the first message to the first
+    reply not sent by the lead; reply gaps run from the last message of a lead
+    turn to the first message of the responder turn after it.
+
+    The dedup key is a hash of the conversation's text that duplicates share.
+    Case, spacing, timestamps and sender names are ignored (senders are
+    numbered by first appearance), so re-exports and threads that differ only
+    in those get the same key. The loose dedup key also ignores digits, which
+    groups threads about different orders, prices or quantities; it is only
+    used when asked for.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.lead = None
+        self.sent = self.received = self.automated = 0
+        self.sender_chars = {}
+        self.first_timestamp = self.last_timestamp = self.last_activity = None
+        self.digest = hashlib.blake2b(digest_size=16)
+        self.loose_digest = hashlib.blake2b(digest_size=16)
+        # Senders numbered by first appearance, for the dedup key
+        self.sender_numbers = {}
+        self.lead_turns = self.responder_turns = 0
+        self.first_time = self.first_response = None
+        self.gaps = []
+        self.previous_side = self.previous_time = None
+
+    def add(self, messages):
+        """
+        Adds the next batch of the conversation's messages.
+        """
+        if not messages:
+            return
+        if not self.total:
+            self.lead = messages[0].get('sender')
+            self.first_timestamp = messages[0].get('timestamp')
+        times = timestamp_values([msg.get('timestamp') for msg in messages])
+        if not self.total:
+            self.first_time = times[0]
+        for msg, sent_at in zip(messages, times):
+            length = len(msg.get('message') or '')
+            sender = msg.get('sender')
+            self.sender_chars[sender] = self.sender_chars.get(sender, 0) + length
+            side = sender == self.lead
+            if side:
+                self.received += length
+            else:
+                self.sent += length
+            if msg.get('is_automated'):
+                self.automated += 1
+
+            number = self.sender_numbers.setdefault(sender, len(self.sender_numbers))
+            text = " ".join(str(msg.get('message') or '').lower().split())
+            self.digest.update(f"{number}\x1f{text}\x1e".encode('utf-8'))
+            self.loose_digest.update(f"{number}\x1f{_DIGITS.sub('0', text)}\x1e".encode('utf-8'))
+
+            if side != self.previous_side:
+                if side:
+                    self.lead_turns += 1
+                else:
+                    self.responder_turns += 1
+                    previous_time = self.previous_time
+                    if self.previous_side is not None and sent_at is not None and previous_time is not None and sent_at >= previous_time:
+                        self.gaps.append(sent_at - previous_time)
+                    if self.first_response is None and sent_at is not None and self.first_time is not None and sent_at >= self.first_time:
+                        self.first_response = sent_at - self.first_time
+            self.previous_side, self.previous_time = side, sent_at
+        self.total += len(messages)
+        self.last_timestamp = messages[-1].get('timestamp')
+        self.last_activity = times[-1]
+
+    def response_times(self):
+        """
+        Returns the response-latency columns.
+        """
+        return {
+            'first_response_seconds': self.first_response,
+            'median_reply_gap_seconds': statistics.median(self.gaps) if self.gaps else None,
+            'lead_turns': self.lead_turns,
+            'responder_turns': self.responder_turns,
+        }
+
+    def result(self):
+        """
+        Returns the columns of the messages added so far.
+        """
+        return {
+            'message_sent_length': self.sent,
+            'message_received_length': self.received,
+            'total_messages': self.total,
+            'distinct_senders': len(self.sender_chars),
+            'sender_chars': dict(self.sender_chars),
+            'automated_share': self.automated / self.total if self.total else 0.0,
+            'first_timestamp': self.first_timestamp,
+            'last_timestamp': self.last_timestamp,
+            'last_activity': self.last_activity,
+            'dedup_key': self.digest.hexdigest() if self.total else None,
+            'loose_dedup_key': self.loose_digest.hexdigest() if self.total else None,
+            **self.response_times(),
+        }
+
+
+def conversation_features(data):
+    """
+    Computes the derived and index columns of one parsed conversation.
+    """
+    features = ConversationFeatures()
+    features.add((data or {}).get('conversation_data') or [])
+    return features.result()
+
+
+def featurize_file(path):
+    """
+    Parses one file (or any entry with read_bytes()) and computes its features.
+
+    Runs inside a worker process for plain files.
+
+    Returns:
+        tuple: (conversation_id, features or None, error message or None)
+    """
+    if isinstance(path, str):
+        path = Path(path)
+    try:
+        return path.stem, conversation_features(loads(path.read_bytes())), None
+    except Exception as e:
+        return path.stem, None, str(e)
+
+
+def featurize_corpus(corpus_dir, store, workers=None, force=False, batch_size=1000):
+    """
+    Computes features for every conversation in a directory without a UI.
+
+    Files are spread over a process pool and results are written to the label
+    store in batches. Files whose content hash matches the one recorded on the
+    previous run are skipped unless force is set.
+
+    Returns:
+        tuple: Counts of (featurized, skipped, failed) files.
+    """
+    scanner = CorpusScanner(corpus_dir)
+    paths = [path for batch in scanner.scan(trust_dir_mtime=False) for path in batch]
+    done = {} if force else store.feature_hashes()
+    todo = [path for path in paths if done.get(path.stem) != scanner.hash_of(path)]
+    print(f"Found {len(paths)} conversations, {len(todo)} new or changed.")
+
+    featurized = failed = 0
+    rows = []
+    for (path,), (conversation_id, features, error) in map_entries(featurize_file, [(path,) for path in todo], workers=workers):
+        if error is not None:
+            failed += 1
+            print(f"Error featurizing {conversation_id}: {error}")
+            continue
+        entry = scanner.entries[path.name]
+        features.update(conversation_id=conversation_id, content_hash=entry['hash'],
+                        file_size=entry['size'], file_mtime=entry['mtime'], index_version=FEATURE_INDEX_VERSION)
+        rows.append(features)
+        if len(rows) >= batch_size:
+            store.save_features(rows)
+            featurized += len(rows)
+            print(f"Featurized {featurized}/{len(todo)} conversations.")
+            rows = []
+    if rows:
+        store.save_features(rows)
+        featurized += len(rows)
+
+    return featurized, len(paths) - len(todo), failed
+
+
+def stale_features(store, entries, stats=None):
+    """
+    Returns (entry, (size, mtime)) for the entries whose stored features are out of date.
+
+    An entry is stale when its size or mtime differs from the stored row, or
+    the row was computed by an older FEATURE_INDEX_VERSION.
+
+    Args:
+        store (LabelStore): Store owned by the calling thread.
+        entries (list): Queue entries (paths or path-like entries).
+        stats (dict): Optional name -> (size, mtime_ns), e.g. from the corpus
+            manifest, to avoid statting every file again.
+    """
+    known = store.feature_stats()
+    stale = []
+    for entry in entries:
+        stat = entry_stat(entry, stats)
+        if known.get(entry.stem) != stat:
+            stale.append((entry, stat))
+    return stale
@@ -0,0 +1,110 @@
+from pathlib import Path
+
+from features import FEATURE_INDEX_VERSION, conversation_features, stale_features
+from parallel import map_entries
+from parsing import loads
+from search import message_rows
+from templates import reply_band_keys
+
+
+def index_file(path, parts):
+    """
+    Parses one conversation once and computes the requested index parts; runs in a worker process.
+
+    Args:
+        path: A file path or any entry with read_bytes().
+        parts (tuple): Any of 'features', 'templates' and 'search'.
+
+    Returns:
+        tuple: (conversation_id, {part: value}, error message or None)
+    """
+    if isinstance(path, str):
+        path = Path(path)
+    try:
+        data = loads(path.read_bytes())
+        result = {}
+        if 'features' in parts:
+            result['features'] = conversation_features(data)
+        if 'templates' in parts:
+            result['templates'] = reply_band_keys(data)
+        if 'search' in parts:
+            result['search'] = message_rows(data)
+        return path.stem, result, None
+    except Exception as e:
+        return path.stem, {}, str(e)
+
+
+def build_indexes(store, template_index, search_index, entries, stats=None, hashes=None, prune=True,
+                  workers=None, progress=None, batch_size=1000, stop=None):
+    """
+    Brings the feature, template and search indexes of the queue entries up to date in one pass.
+
+    Each entry that one of the indexes is missing is read and parsed once, and
+    only the parts that are out of date are computed from it. Plain files are
+    processed on a process pool, other entries inline; results are written to
+    each index in batches of batch_size conversations.
+
+    Args:
+        store (LabelStore), template_index (TemplateIndex), search_index (SearchIndex):
+            Owned by the calling thread.
+        entries (list): Queue entries (paths or path-like entries).
+        stats (dict): Optional name -> (size, mtime_ns), e.g. from the corpus
+            manifest, to avoid statting every file again.
+        hashes (dict): Optional name -> content hash to record with each feature row.
+        prune (bool): Drop search results of conversations missing from entries;
+            pass False when entries is only a part of the corpus.
+        progress (callable): Called with (done, total) after every batch.
+        stop (threading.Event): Set to stop early; what was indexed so far is kept.
+
+    Returns:
+        dict: The number of conversations (re)indexed per part.
+    """
+    hashes = hashes or {}
+    todo = {
+        'features': dict((entry.name, stat) for entry, stat in stale_features(store, entries, stats)),
+        'templates': {entry.name for entry in template_index.new_entries(entries)},
+        'search': dict((entry.name, stat) for entry, stat in search_index.stale(entries, stats, prune=prune)),
+    }
+    jobs = []
+    for entry in entries:
+        parts = tuple(part for part, names in todo.items() if entry.name in names)
+        if parts:
+            jobs.append((entry, parts))
+
+    feature_rows, band_counts, counted, search_batch = [], {}, [], []
+
+    def write():
+        nonlocal feature_rows, band_counts, counted, search_batch
+        if feature_rows:
+            store.save_features(feature_rows)
+        if counted:
+            template_index.merge(band_counts, counted)
+        if search_batch:
+            search_index.add(search_batch)
+        feature_rows, band_counts, counted, search_batch = [], {}, [], []
+
+    results = map_entries(index_file, jobs, workers=workers, stop=stop)
+    for done, ((entry, parts), (conversation_id, result, error)) in enumerate(results, start=1):
+        if error is not None:
+            print(f"Error indexing {conversation_id}: {error}")
+        if 'features' in parts:
+            # Failed files are stored too, so they are not retried until they change
+            size, mtime = todo['features'][entry.name]
+            features = result.get('features', {})
+            features.update(conversation_id=conversation_id, content_hash=hashes.get(entry.name),
+                            file_size=size, file_mtime=mtime, index_version=FEATURE_INDEX_VERSION)
+            feature_rows.append(features)
+        if 'templates' in parts and error is None:
+            for key in result['templates']:
+                band_counts[key] = band_counts.get(key, 0) + 1
+            counted.append(conversation_id)
+        if 'search' in parts:
+            search_batch.append((conversation_id, todo['search'][entry.name], result.get('search', [])))
+        if done % batch_size == 0:
+            write()
+            if progress:
+                progress(done, len(jobs))
+    write()
+    if progress:
+        progress(len(jobs), len(jobs))
+    return {part: len(names) for part, names in todo.items()}
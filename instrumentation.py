@@ -0,0 +1,123 @@
+import cProfile
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+
+class LatencyRecorder:
+    """
+    Records wall time per stage in rolling windows and reports percentiles.
+
+    Each stage keeps its last window samples, so the histogram reflects the
+    current session rather than growing without bound.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.samples = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self.lock:
+            if stage not in self.samples:
+                self.samples[stage] = deque(maxlen=self.window)
+                self.counts[stage] = 0
+            self.samples[stage].append(seconds)
+            self.counts[stage] += 1
+
+    @contextmanager
+    def timed(self, stage):
+        """
+        Context manager recording the wall time of its block under stage.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def track(self, stage):
+        """
+        Decorator recording the wall time of every call under stage.
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timed(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def summary(self):
+        """
+        Returns {stage: {"count", "p50_ms", "p95_ms", "p99_ms", "max_ms"}}.
+        """
+        with self.lock:
+            snapshot = {stage: sorted(samples) for stage, samples in self.samples.items()}
+            counts = dict(self.counts)
+        summary = {}
+        for stage, ordered in snapshot.items():
+            def pct(p):
+                return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000
+            summary[stage] = {
+                'count': counts[stage],
+                'p50_ms': round(pct(50), 3),
+                'p95_ms': round(pct(95), 3),
+                'p99_ms': round(pct(99), 3),
+                'max_ms': round(ordered[-1] * 1000, 3),
+            }
+        return summary
+
+    def export(self, metrics_file):
+        """
+        Appends the current summary as one JSON line to metrics_file.
+        """
+        record = {'time': datetime.now().isoformat(timespec='seconds'), 'pid': os.getpid(), 'stages': self.summary()}
+        with open(metrics_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + "\n")
+
+    def format_table(self):
+        lines = [f"{'stage':<22}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}  ms"]
+        for stage, stats in sorted(self.summary().items()):
+            lines.append(f"{stage:<22}{stats['count']:>6}{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}")
+        return "\n".join(lines)
+
+
+class SessionProfiler:
+    """
+    Captures a cProfile profile and tracemalloc snapshot for one session.
+    """
+
+    def __init__(self, output_prefix):
+        self.output_prefix = output_prefix
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        tracemalloc.start(25)
+        self.profile.enable()
+
+    def stop(self):
+        """
+        Stops capturing and writes <prefix>.prof and <prefix>.memory.txt.
+        """
+        self.profile.disable()
+        self.profile.dump_stats(f"{self.output_prefix}.prof")
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        with open(f"{self.output_prefix}.memory.txt", 'w', encoding='utf-8') as f:
+            f.write(f"current: {current / 1024 / 1024:.1f} MiB, peak: {peak / 1024 / 1024:.1f} MiB\n\n")
+            for stat in snapshot.statistics('lineno')[:50]:
+                f.write(f"{stat}\n")
+        print(f"Profile written to {self.output_prefix}.prof and {self.output_prefix}.memory.txt")
+
+
+# Shared recorder used throughout the labeler
+metrics = LatencyRecorder()
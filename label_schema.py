@@ -0,0 +1,75 @@
+import json
+import re
+from collections import namedtuple
+from pathlib import Path
+
+from features import FEATURE_COLUMNS
+
+# Segments, metrics and their scales shipped with the labeler
+DEFAULT_SCHEMA_FILE = Path(__file__).with_name("label_schema.json")
+
+# Label columns that are not metrics and cannot be reused as metric columns
+RESERVED_COLUMNS = {'conversation_id', 'segment', 'comments', *FEATURE_COLUMNS}
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+Segment = namedtuple('Segment', ['name', 'color', 'description'])
+# values are the choices in display order; explanations, if given, are parallel to values
+Metric = namedtuple('Metric', ['name', 'column', 'label', 'values', 'explanations', 'explanation_title'])
+LabelSchema = namedtuple('LabelSchema', ['segments', 'metrics'])
+
+
+def is_numeric(metric):
+    """
+    Returns True if every choice of the metric is a whole number (stored as INTEGER).
+    """
+    return all(isinstance(value, int) and not isinstance(value, bool) for value in metric.values)
+
+
+def load_schema(schema_file=None):
+    """
+    Reads and checks a label schema file (JSON with "segments" and "metrics").
+
+    Raises:
+        ValueError: If the file is not a valid schema; the message names the problem.
+    """
+    schema_file = Path(schema_file or DEFAULT_SCHEMA_FILE)
+    try:
+        with open(schema_file, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ValueError(f"Cannot read label schema {schema_file}: {str(e)}")
+
+    segments = []
+    for item in raw.get('segments') or []:
+        if not item.get('name'):
+            raise ValueError(f"{schema_file}: every segment needs a name")
+        segments.append(Segment(str(item['name']), item.get('color', '#DDDDDD'), item.get('description', '')))
+    if not segments:
+        raise ValueError(f"{schema_file}: at least one segment is required")
+    if len({segment.name for segment in segments}) != len(segments):
+        raise ValueError(f"{schema_file}: segment names must be unique")
+
+    metrics = []
+    for item in raw.get('metrics') or []:
+        name = item.get('name')
+        column = item.get('column', name)
+        values = item.get('values') or []
+        explanations = item.get('explanations') or []
+        if not name or not _IDENTIFIER.match(str(column or '')):
+            raise ValueError(f"{schema_file}: metric {name!r} needs a name and a column made of letters, digits and _")
+        if column in RESERVED_COLUMNS:
+            raise ValueError(f"{schema_file}: metric {name!r} cannot use the reserved column {column!r}")
+        if not values or any(value in (0, '', None) for value in values):
+            raise ValueError(f"{schema_file}: metric {name!r} needs a list of values (0 and \"\" mean unset)")
+        if explanations and len(explanations) != len(values):
+            raise ValueError(f"{schema_file}: metric {name!r} has {len(values)} values but {len(explanations)} explanations")
+        metrics.append(Metric(name, column, item.get('label', name), values, explanations,
+                              item.get('explanation_title', item.get('label', name))))
+    if not metrics:
+        raise ValueError(f"{schema_file}: at least one metric is required")
+    for key in ('name', 'column'):
+        if len({getattr(metric, key) for metric in metrics}) != len(metrics):
+            raise ValueError(f"{schema_file}: metric {key}s must be unique")
+
+    return LabelSchema(segments, metrics)
@@ -0,0 +1,720 @@
+import csv
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from features import FEATURE_COLUMNS, FEATURE_INDEX_VERSION
+from work_queue import WORK_ITEMS_SCHEMA
+
+# Metric columns of the default label schema (label_schema.json)
+DEFAULT_METRIC_COLUMNS = ['sentiment', 'engagement_score', 'customer_effort_score', 'response_type']
+
+
+def label_columns(metric_columns):
+    """
+    Returns the columns of the exported label sheet for the given metrics, in output order.
+    """
+    return ['conversation_id', 'segment', *metric_columns, 'comments', *FEATURE_COLUMNS]
+
+
+LABEL_COLUMNS = label_columns(DEFAULT_METRIC_COLUMNS)
+
+# Columns of the per-conversation features table besides conversation_id
+FEATURE_TABLE_COLUMNS = {
+    'content_hash': 'TEXT',
+    'file_size': 'INTEGER',
+    'file_mtime': 'INTEGER',
+    'message_sent_length': 'INTEGER',
+    'message_received_length': 'INTEGER',
+    'total_messages': 'INTEGER',
+    'distinct_senders': 'INTEGER',
+    'sender_chars': 'TEXT',
+    'automated_share': 'REAL',
+    'first_timestamp': 'TEXT',
+    'last_timestamp': 'TEXT',
+    'last_activity': 'REAL',
+    'dedup_key': 'TEXT',
+    'loose_dedup_key': 'TEXT',
+    'first_response_seconds': 'REAL',
+    'median_reply_gap_seconds': 'REAL',
+    'lead_turns': 'INTEGER',
+    'responder_turns': 'INTEGER',
+    'index_version': 'INTEGER',
+}
+
+
+class LabelStore:
+    """
+    Embedded SQLite store for segment labels, keyed by (conversation_id, segment).
+
+    Each save is a single small transaction, so its cost does not grow with the
+    number of conversations already labeled. The Excel workbook is produced on
+    demand by export_excel(), or streamed in chunks by export_csv() and
+    export_parquet(). Metric columns come from the label schema; ones the table
+    does not have yet are added when the store is opened.
+
+    Per segment and metric, the number of labels with each value is kept in a
+    rollups table that every save updates in the same transaction, so summary
+    statistics never need a pass over the labels.
+    """
+
+    def __init__(self, db_file, synchronous="FULL", journal_mode="WAL", track_work=False, metric_columns=None):
+        self.db_file = str(db_file)
+        self.track_work = track_work
+        self.metric_columns = list(metric_columns or DEFAULT_METRIC_COLUMNS)
+        self.label_columns = label_columns(self.metric_columns)
+        # Several annotators may share the file, so wait for their locks instead of failing
+        self.conn = sqlite3.connect(self.db_file, timeout=30)
+        # WAL keeps readers unblocked while saving; FULL sync makes every commit durable,
+        # NORMAL defers syncing to checkpoints (see LabelWriter). Shared files on network
+        # disks need a rollback journal (journal_mode="DELETE").
+        self.conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        self.conn.execute(f"PRAGMA synchronous={synchronous}")
+        with self.conn:
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS labels (
+                    conversation_id TEXT NOT NULL,
+                    segment TEXT NOT NULL,
+                    sentiment INTEGER,
+                    engagement_score INTEGER,
+                    customer_effort_score INTEGER,
+                    response_type TEXT,
+                    comments TEXT,
+                    message_sent_length INTEGER,
+                    message_received_length INTEGER,
+                    total_messages INTEGER,
+                    PRIMARY KEY (conversation_id, segment)
+                )
+                """
+            )
+            existing = {row[1] for row in self.conn.execute("PRAGMA table_info(labels)")}
+            for column in self.label_columns:
+                if column not in existing:
+                    # Metric columns get no declared type, so numbers and text are both stored as given
+                    column_type = FEATURE_TABLE_COLUMNS[column] if column in FEATURE_COLUMNS else ''
+                    self.conn.execute(f"ALTER TABLE labels ADD COLUMN {column} {column_type}")
+            # Number of labels per segment, metric column and value
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS rollups ("
+                "segment TEXT NOT NULL, metric TEXT NOT NULL, value NOT NULL, count INTEGER NOT NULL, "
+                "PRIMARY KEY (segment, metric, value))"
+            )
+            # Store bookkeeping, e.g. which metric columns the rollups were built for
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            # Derived per-conversation columns and the queue sort/filter index,
+            # filled in by the batch featurizer and indexing.build_indexes()
+            self.conn.execute("CREATE TABLE IF NOT EXISTS features (conversation_id TEXT PRIMARY KEY)")
+            existing = {row[1] for row in self.conn.execute("PRAGMA table_info(features)")}
+            for column, column_type in FEATURE_TABLE_COLUMNS.items():
+                if column not in existing:
+                    self.conn.execute(f"ALTER TABLE features ADD COLUMN {column} {column_type}")
+            for column in ('total_messages', 'distinct_senders', 'last_activity', 'dedup_key', 'loose_dedup_key'):
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS features_{column} ON features ({column})")
+            if self.track_work:
+                self.conn.execute(WORK_ITEMS_SCHEMA)
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'rollup_metrics'").fetchone()
+        if row is None or json.loads(row[0]) != self.metric_columns:
+            # Labels saved before rollups existed, or under another label schema
+            self.rebuild_rollups()
+
+    def is_empty(self):
+        """
+        Returns True if no labels have been stored yet.
+        """
+        return self.conn.execute("SELECT 1 FROM labels LIMIT 1").fetchone() is None
+
+    def save_conversation(self, conversation_id, rows):
+        """
+        Upserts the segment rows of one conversation in a single transaction.
+
+        Segments of the conversation that are not present in rows are removed, so
+        the stored labels always mirror the last save of that conversation.
+
+        Args:
+            conversation_id (str): The conversation the rows belong to.
+            rows (list[dict]): One dict per segment, keyed by the label columns.
+        """
+        with self.conn:
+            self._upsert_rows(conversation_id, rows)
+
+    def save_conversations(self, items):
+        """
+        Saves several conversations, given as (conversation_id, rows) pairs, in one transaction.
+        """
+        with self.conn:
+            for conversation_id, rows in items:
+                self._upsert_rows(conversation_id, rows)
+
+    def _upsert_rows(self, conversation_id, rows):
+        """
+        Upserts the rows of one conversation inside the caller's transaction.
+        """
+        columns = self.label_columns[1:]
+        placeholders = ", ".join("?" for _ in self.label_columns)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns[1:])
+        segments = [row['segment'] for row in rows]
+
+        # The rollups lose the values of the rows being replaced and gain the new ones
+        deltas = {}
+        previous = self.conn.execute(
+            f"SELECT segment, {', '.join(self.metric_columns)} FROM labels WHERE conversation_id = ?",
+            (conversation_id,),
+        )
+        for segment, *values in previous:
+            for metric, value in zip(self.metric_columns, values):
+                if value is not None:
+                    deltas[(segment, metric, value)] = deltas.get((segment, metric, value), 0) - 1
+        for row in rows:
+            for metric in self.metric_columns:
+                value = row.get(metric)
+                if value is not None:
+                    deltas[(row['segment'], metric, value)] = deltas.get((row['segment'], metric, value), 0) + 1
+
+        self.conn.execute(
+            f"DELETE FROM labels WHERE conversation_id = ? "
+            f"AND segment NOT IN ({', '.join('?' for _ in segments)})",
+            [conversation_id, *segments],
+        )
+        self.conn.executemany(
+            f"INSERT INTO labels ({', '.join(self.label_columns)}) VALUES ({placeholders}) "
+            f"ON CONFLICT (conversation_id, segment) DO UPDATE SET {updates}",
+            [[conversation_id] + [row.get(column) for column in columns] for row in rows],
+        )
+        changes = [(segment, metric, value, delta) for (segment, metric, value), delta in deltas.items() if delta]
+        if changes:
+            self.conn.executemany(
+                "INSERT INTO rollups (segment, metric, value, count) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (segment, metric, value) DO UPDATE SET count = count + excluded.count",
+                changes,
+            )
+            if any(delta < 0 for *_, delta in changes):
+                self.conn.execute("DELETE FROM rollups WHERE count <= 0")
+        if self.track_work:
+            # Completes the shared work item atomically with its labels
+            self.conn.execute(
+                "UPDATE work_items SET status = 'done', owner = NULL, lease_expires = NULL WHERE conversation_id = ?",
+                (conversation_id,),
+            )
+
+    def sync(self):
+        """
+        Checkpoints the write-ahead log, forcing committed labels to disk.
+        """
+        self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def labeled_ids(self, segments):
+        """
+        Returns the set of conversation_ids that have a row for every given segment.
+        """
+        rows = self.conn.execute(
+            f"SELECT conversation_id FROM labels WHERE segment IN ({', '.join('?' for _ in segments)}) "
+            f"GROUP BY conversation_id HAVING COUNT(DISTINCT segment) = ?",
+            [*segments, len(segments)],
+        )
+        return {conversation_id for (conversation_id,) in rows}
+
+    def saved_labels(self):
+        """
+        Returns the stored metric values of every conversation.
+
+        Returns:
+            dict: conversation_id -> segment -> tuple of values in metric_columns order.
+        """
+        labels = {}
+        rows = self.conn.execute(f"SELECT conversation_id, segment, {', '.join(self.metric_columns)} FROM labels")
+        for conversation_id, segment, *values in rows:
+            labels.setdefault(conversation_id, {})[segment] = tuple(values)
+        return labels
+
+    def save_features(self, rows):
+        """
+        Upserts derived feature rows (keyed by conversation_id) in one transaction.
+        """
+        columns = ['conversation_id'] + list(FEATURE_TABLE_COLUMNS)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns[1:])
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT INTO features ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+                f"ON CONFLICT (conversation_id) DO UPDATE SET {updates}",
+                [
+                    [json.dumps(row[column]) if column == 'sender_chars' and row.get(column) is not None else row.get(column)
+                     for column in columns]
+                    for row in rows
+                ],
+            )
+
+    def rebuild_rollups(self):
+        """
+        Recomputes the rollups table from all stored labels and records the metrics it covers.
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM rollups")
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('rollup_metrics', ?)", (json.dumps(self.metric_columns),)
+            )
+            for metric in self.metric_columns:
+                self.conn.execute(
+                    f"INSERT INTO rollups (segment, metric, value, count) "
+                    f"SELECT segment, ?, {metric}, COUNT(*) FROM labels WHERE {metric} IS NOT NULL GROUP BY segment, {metric}",
+                    (metric,),
+                )
+
+    def rollups(self):
+        """
+        Returns per-segment statistics of every metric from the rollups table.
+
+        The table holds one row per segment, metric and distinct value, so this
+        takes the same time however many conversations are labeled.
+
+        Returns:
+            dict: {segment: {metric column: {"count", "mean", "distribution"}}}, where
+            distribution maps each value to its number of labels and mean is None
+            for metrics with non-numeric values.
+        """
+        summary = {}
+        for segment, metric, value, count in self.conn.execute(
+            "SELECT segment, metric, value, count FROM rollups WHERE count > 0 ORDER BY segment, metric, value"
+        ):
+            stats = summary.setdefault(segment, {}).setdefault(metric, {'count': 0, 'mean': None, 'distribution': {}})
+            stats['distribution'][value] = count
+            stats['count'] += count
+        for metrics in summary.values():
+            for stats in metrics.values():
+                values = stats['distribution']
+                if all(isinstance(value, (int, float)) for value in values):
+                    stats['mean'] = sum(value * count for value, count in values.items()) / stats['count']
+        return summary
+
+    def feature_hashes(self):
+        """
+        Returns the content hash each featurized conversation was computed from.
+
+        Rows computed by an older FEATURE_INDEX_VERSION are left out, so they are rebuilt.
+        """
+        return dict(self.conn.execute(
+            "SELECT conversation_id, content_hash FROM features WHERE index_version = ?", (FEATURE_INDEX_VERSION,)
+        ))
+
+    def feature_stats(self):
+        """
+        Returns the (size, mtime) each indexed conversation's features were computed from.
+
+        Rows computed by an older FEATURE_INDEX_VERSION are left out, so they are rebuilt.
+        """
+        rows = self.conn.execute(
+            "SELECT conversation_id, file_size, file_mtime FROM features WHERE index_version = ?",
+            (FEATURE_INDEX_VERSION,),
+        )
+        return {conversation_id: (size, mtime) for conversation_id, size, mtime in rows}
+
+    def response_times(self, conversation_id):
+        """
+        Returns the indexed first-response time, median reply gap and turn counts of a conversation.
+
+        Returns None if the conversation is not indexed at the current FEATURE_INDEX_VERSION.
+        """
+        row = self.conn.execute(
+            "SELECT first_response_seconds, median_reply_gap_seconds, lead_turns, responder_turns FROM features "
+            "WHERE conversation_id = ? AND index_version = ?",
+            (conversation_id, FEATURE_INDEX_VERSION),
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('first_response_seconds', 'median_reply_gap_seconds', 'lead_turns', 'responder_turns'), row))
+
+    def duplicate_groups(self, ignore_digits=False):
+        """
+        Returns lists of conversation_ids that share a dedup_key, one list per key shared by several.
+
+        With ignore_digits, conversations that differ only in their numbers are grouped too.
+        """
+        key = 'loose_dedup_key' if ignore_digits else 'dedup_key'
+        rows = self.conn.execute(
+            f"SELECT {key}, conversation_id FROM features WHERE {key} IN ("
+            f"SELECT {key} FROM features WHERE {key} IS NOT NULL GROUP BY {key} HAVING COUNT(*) > 1"
+            f") ORDER BY {key}"
+        )
+        groups = {}
+        for key, conversation_id in rows:
+            groups.setdefault(key, []).append(conversation_id)
+        return list(groups.values())
+
+    def query_features(self, min_messages=0, min_senders=0, max_automated_share=1.0, order_by=None):
+        """
+        Returns the conversation_ids whose features pass the filters, in order_by order.
+
+        Args:
+            order_by (str): An SQL ORDER BY expression over the features columns,
+                or None for no particular order.
+        """
+        sql = (
+            "SELECT conversation_id FROM features "
+            "WHERE COALESCE(total_messages, 0) >= ? AND COALESCE(distinct_senders, 0) >= ? "
+            "AND COALESCE(automated_share, 0) <= ?"
+        )
+        if order_by:
+            sql += f" ORDER BY {order_by}"
+        rows = self.conn.execute(sql, (min_messages, min_senders, max_automated_share))
+        return [conversation_id for (conversation_id,) in rows]
+
+    def import_excel(self, excel_file):
+        """
+        Imports labels from a workbook written by earlier versions of the labeler.
+        """
+        # pandas/openpyxl are slow to import and only needed here and in export_excel
+        import pandas as pd
+
+        df = pd.read_excel(excel_file)
+        if df.empty:
+            return 0
+        df = df.reindex(columns=self.label_columns)
+        df['conversation_id'] = df['conversation_id'].astype(str)
+        df = df.astype(object).where(pd.notna(df), None)
+        for conversation_id, group in df.groupby('conversation_id', sort=False):
+            self.save_conversation(conversation_id, group.to_dict('records'))
+        return len(df)
+
+    def export_excel(self, excel_file):
+        """
+        Writes all stored labels to an Excel workbook.
+
+        The workbook is written to a temporary file first and then moved into
+        place, so an interrupted export never leaves a truncated file behind.
+        """
+        import pandas as pd
+
+        df = pd.read_sql_query(self.export_query(), self.conn)
+        excel_file = Path(excel_file)
+        tmp_file = excel_file.with_name(f"~{excel_file.name}")
+        df.to_excel(tmp_file, index=False)
+        os.replace(tmp_file, excel_file)
+        return len(df)
+
+    def export_query(self):
+        """
+        Returns the SELECT producing the export rows, in label_columns order.
+        """
+        # Derived columns fall back to the featurizer output when a save left them empty
+        selected = [
+            f"COALESCE(l.{column}, f.{column}) AS {column}" if column in FEATURE_COLUMNS else f"l.{column}"
+            for column in self.label_columns
+        ]
+        return (
+            f"SELECT {', '.join(selected)} FROM labels l "
+            f"LEFT JOIN features f ON f.conversation_id = l.conversation_id ORDER BY l.rowid"
+        )
+
+    def export_chunks(self, chunk_size):
+        """
+        Yields the export rows in lists of at most chunk_size tuples.
+        """
+        cursor = self.conn.execute(self.export_query())
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+    def export_csv(self, csv_file, chunk_size=5000):
+        """
+        Streams all stored labels to a CSV file, holding one chunk in memory at a time.
+        """
+        csv_file = Path(csv_file)
+        tmp_file = csv_file.with_name(f"~{csv_file.name}")
+        count = 0
+        with open(tmp_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.label_columns)
+            for rows in self.export_chunks(chunk_size):
+                writer.writerows(rows)
+                count += len(rows)
+        os.replace(tmp_file, csv_file)
+        return count
+
+    def column_types(self):
+        """
+        Returns the type ('INTEGER', 'REAL' or 'TEXT') of each export column.
+
+        Derived columns have the types of the features table, whatever the
+        labels table declares (older databases added them untyped). Untyped
+        metric columns are typed by every value they hold: TEXT if any value
+        is text, else REAL if any is a float, else INTEGER.
+        """
+        declared = {row[1]: row[2].upper() for row in self.conn.execute("PRAGMA table_info(labels)")}
+        kinds = {
+            column: FEATURE_TABLE_COLUMNS[column] if column in FEATURE_COLUMNS else declared.get(column) or ''
+            for column in self.label_columns
+        }
+        untyped = [column for column in self.label_columns if not kinds[column]]
+        if untyped:
+            # One pass over the table for all untyped columns
+            seen = self.conn.execute("SELECT " + ", ".join(
+                f"MAX(typeof({column}) IN ('text', 'blob')), MAX(typeof({column}) = 'real'), MAX(typeof({column}) = 'integer')"
+                for column in untyped
+            ) + " FROM labels").fetchone()
+            for idx, column in enumerate(untyped):
+                text, real, integer = seen[idx * 3:idx * 3 + 3]
+                kinds[column] = 'TEXT' if text or not (real or integer) else 'REAL' if real else 'INTEGER'
+        return kinds
+
+    def export_parquet(self, parquet_file, chunk_size=50000):
+        """
+        Streams all stored labels to a Parquet file, one row group per chunk.
+
+        Requires pyarrow.
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+
+        kinds = self.column_types()
+        schema = pa.schema([
+            pa.field(column, pa.int64() if kinds[column] == 'INTEGER' else pa.float64() if kinds[column] == 'REAL' else pa.string())
+            for column in self.label_columns
+        ])
+
+        parquet_file = Path(parquet_file)
+        tmp_file = parquet_file.with_name(f"~{parquet_file.name}")
+        count = 0
+        with pq.ParquetWriter(str(tmp_file), schema) as writer:
+            for rows in self.export_chunks(chunk_size):
+                columns = []
+                for field, values in zip(schema, zip(*rows)):
+                    if pa.types.is_string(field.type):
+                        values = [None if value is None else str(value) for value in values]
+                    columns.append(pa.array(values, type=field.type))
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+                count += len(rows)
+        os.replace(tmp_file, parquet_file)
+        return count
+
+    def close(self):
+        self.conn.close()
+
+
+class LabelWriter:
+    """
+    Write-behind writer that keeps label saves off the UI thread.
+
+    Saves are queued and drained by a single background thread. Repeated saves
+    of the same conversation that arrive before a commit are coalesced, queued
+    saves are committed together in one transaction, and the log is synced to
+    disk every flush_interval seconds and on close(). Failures are passed to
+    on_error(exception) from the writer thread and the affected saves are
+    retried on the next tick. On close() failed saves are retried with backoff
+    for up to stop_retry_seconds; whatever still cannot be committed is appended
+    to a journal next to the database ("<db>.unsaved.jsonl") and committed by
+    the next LabelWriter opened on that database. While the database cannot be
+    opened at all, saves go to the journal straight away. Extra keyword
+    arguments are passed to LabelStore.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db_file, on_error=None, flush_interval=2.0, stop_retry_seconds=30.0, **store_options):
+        self.db_file = str(db_file)
+        self.journal_file = Path(self.db_file + ".unsaved.jsonl")
+        self.store_options = store_options
+        self.on_error = on_error
+        self.flush_interval = flush_interval
+        self.stop_retry_seconds = stop_retry_seconds
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="label-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, conversation_id, rows):
+        """
+        Queues the rows of one conversation for saving and returns immediately.
+        """
+        self.queue.put((conversation_id, rows))
+
+    def submit_many(self, items):
+        """
+        Queues several (conversation_id, rows) pairs that are committed in the same transaction.
+        """
+        self.queue.put(list(items))
+
+    def flush(self, timeout=None):
+        """
+        Blocks until everything queued so far is committed and synced.
+
+        Returns:
+            bool: True once committed; False if the commit failed (the saves stay
+            queued and are retried) or timeout passed first.
+        """
+        waiter = _FlushWaiter()
+        self.queue.put(waiter)
+        return waiter.done.wait(timeout) and waiter.ok
+
+    def close(self, timeout=None):
+        """
+        Commits and syncs all queued saves, then stops the writer thread.
+        """
+        self.queue.put(self._STOP)
+        self.thread.join(timeout)
+
+    def read_journal(self):
+        """
+        Claims the journal left by an earlier writer.
+
+        Returns:
+            tuple: ([(conversation_id, rows), ...], claimed file to remove once committed),
+            or ([], None) if there is no journal.
+        """
+        # Renamed first, so saves journaled meanwhile by another writer are not lost
+        claimed = self.journal_file.with_name(f"{self.journal_file.name}.{os.getpid()}")
+        try:
+            os.replace(self.journal_file, claimed)
+        except OSError:
+            return [], None
+        items = []
+        with open(claimed, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    items.append((entry['conversation_id'], entry['rows']))
+        return items, claimed
+
+    def write_journal(self, pending):
+        """
+        Appends saves that could not be committed to the journal.
+        """
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            for conversation_id, rows in pending.items():
+                f.write(json.dumps({'conversation_id': conversation_id, 'rows': rows}, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def journal_pending(self, pending, claimed):
+        """
+        Moves pending saves to the journal; returns the claimed journal still to remove.
+
+        The claimed journal's saves are among the pending ones, so it is removed
+        once they are journaled again. If the journal cannot be written the saves
+        stay pending.
+        """
+        try:
+            self.write_journal(pending)
+        except OSError as e:
+            print(f"Could not commit or journal {len(pending)} saves: {str(e)}")
+            return claimed
+        print(f"Could not commit {len(pending)} saves; they were written to {self.journal_file} "
+              f"and are retried on the next start.")
+        pending.clear()
+        if claimed is not None:
+            os.remove(claimed)
+        return None
+
+    def run(self):
+        # Opened in the retry loop below, so an unopenable database is reported
+        # and retried like a failed commit
+        store = None
+        claimed = None
+        pending = OrderedDict()
+        waiters = []
+        last_sync = time.monotonic()
+        dirty = False
+        last_error = None
+        stop_deadline = None
+        backoff = 0.1
+
+        while True:
+            if stop_deadline is not None:
+                # Stopping: nothing new arrives, only the failed commit is retried
+                item = None
+            else:
+                timeout = max(0.0, self.flush_interval - (time.monotonic() - last_sync))
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+            # Drain whatever else is queued so it lands in the same transaction
+            while item is not None:
+                if item is self._STOP:
+                    stop_deadline = time.monotonic() + self.stop_retry_seconds
+                elif isinstance(item, _FlushWaiter):
+                    waiters.append(item)
+                else:
+                    for conversation_id, rows in (item if isinstance(item, list) else [item]):
+                        # Only the latest save of a conversation is written
+                        pending.pop(conversation_id, None)
+                        pending[conversation_id] = rows
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    item = None
+
+            ok = False
+            try:
+                if store is None:
+                    store = LabelStore(self.db_file, **{'synchronous': "NORMAL", **self.store_options})
+                    journaled, claimed = self.read_journal() if self.journal_file.exists() else ([], None)
+                    if journaled:
+                        print(f"Retrying {len(journaled)} saves left unsaved by an earlier session.")
+                        # Saves queued meanwhile are newer than the journaled ones
+                        journaled = OrderedDict(journaled)
+                        journaled.update(pending)
+                        pending = journaled
+                if pending:
+                    store.save_conversations(pending.items())
+                    pending.clear()
+                    dirty = True
+                    if claimed is not None:
+                        # The journaled saves are in the database now
+                        os.remove(claimed)
+                        claimed = None
+                if dirty and (stop_deadline is not None or waiters or time.monotonic() - last_sync >= self.flush_interval):
+                    store.sync()
+                    dirty = False
+                if not dirty:
+                    last_sync = time.monotonic()
+                last_error = None
+                ok = True
+                backoff = 0.1
+            except Exception as e:
+                # Report each distinct failure once; pending saves are retried next tick
+                if self.on_error and str(e) != last_error:
+                    self.on_error(e)
+                last_error = str(e)
+                last_sync = time.monotonic()
+                if store is None and pending:
+                    # Until the database opens, saves are kept safe in the journal
+                    claimed = self.journal_pending(pending, claimed)
+
+            # Waiters only hear success once their saves are committed
+            for waiter in waiters:
+                waiter.ok = ok
+                waiter.done.set()
+            waiters = []
+
+            if stop_deadline is None:
+                continue
+            if not pending and (ok or store is None):
+                break
+            if time.monotonic() >= stop_deadline:
+                self.journal_pending(pending, claimed)
+                break
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 5.0)
+
+        if store is not None:
+            store.close()
+
+
+class _FlushWaiter:
+    """
+    A flush() call waiting for the writer thread; ok tells whether the commit succeeded.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
@@ -0,0 +1,73 @@
+import tkinter as tk
+
+from label_schema import is_numeric
+
+# Background of a row with nothing selected
+UNSET_BG = '#333333'
+
+
+class MetricRow:
+    """
+    One metric of one segment: a caption and a radio button per value.
+
+    The row is highlighted in its segment color once a value is chosen. It keeps
+    track of its own state and only reconfigures its widgets when that state
+    changes, so rewriting a value, clearing an empty row or re-enabling an
+    enabled one does not touch any widget.
+    """
+
+    def __init__(self, parent, metric, color):
+        self.metric = metric
+        self.color = color
+        # Radio buttons need a value meaning "nothing selected"
+        self.empty = 0 if is_numeric(metric) else ''
+        self.var = tk.IntVar(value=0) if is_numeric(metric) else tk.StringVar(value='')
+        self.selected = False
+        self.enabled = True
+
+        self.frame = tk.Frame(parent, bg=UNSET_BG)
+        self.frame.pack(anchor="w", pady=2, fill="x")
+        self.widgets = [tk.Label(self.frame, text=metric.label, bg=UNSET_BG, font=('Segoe UI', 10, 'bold'))]
+        self.widgets[0].pack(side=tk.LEFT, padx=(0, 5))
+        for value in metric.values:
+            rb = tk.Radiobutton(self.frame, text=str(value), variable=self.var, value=value, bg=UNSET_BG, font=('Segoe UI', 10, 'bold'))
+            rb.pack(side=tk.LEFT, padx=2)
+            self.widgets.append(rb)
+        self.var.trace_add("write", self.on_write)
+
+    def get(self):
+        """
+        Returns the chosen value, or None if nothing is selected.
+        """
+        value = self.var.get()
+        return None if value == self.empty else value
+
+    def set(self, value):
+        value = self.empty if value is None else value
+        if self.var.get() != value:
+            self.var.set(value)
+
+    def clear(self):
+        self.set(None)
+
+    def on_write(self, *args):
+        selected = self.var.get() != self.empty
+        if selected == self.selected:
+            return
+        self.selected = selected
+        bg = self.color if selected else UNSET_BG
+        self.frame.configure(bg=bg)
+        for widget in self.widgets:
+            widget.configure(bg=bg)
+
+    def set_enabled(self, enabled):
+        """
+        Enables or disables the row; a disabled row is also cleared.
+        """
+        if not enabled:
+            self.clear()
+        if enabled == self.enabled:
+            return
+        self.enabled = enabled
+        for widget in self.widgets:
+            widget.configure(state="normal" if enabled else "disabled")
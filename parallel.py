@@ -0,0 +1,66 @@
+import os
+from collections import deque
+from pathlib import Path
+
+
+def entry_stat(entry, stats=None):
+    """
+    Returns (size, mtime_ns) of a queue entry, from stats (name -> (size, mtime_ns)) if it is there.
+    """
+    stat = (stats or {}).get(entry.name)
+    if stat is None:
+        entry_stat = entry.stat()
+        stat = (entry_stat.st_size, entry_stat.st_mtime_ns)
+    return tuple(stat)
+
+
+def _run_chunk(function, jobs):
+    # Runs in a worker process
+    return [function(*job) for job in jobs]
+
+
+def map_entries(function, jobs, workers=None, stop=None):
+    """
+    Yields (job, function(*job)) for each job, a tuple whose first item is a queue entry.
+
+    Jobs on plain files run on a process pool, in order; jobs on entries that
+    cannot be sent to another process (shard lines, archive members, gzipped
+    files) run inline afterwards. function must be importable by the workers.
+
+    Work is handed to the pool a few chunks at a time, so once the stop event
+    is set no new chunks start, queued ones are cancelled and the generator
+    returns without waiting for the running ones.
+    """
+    # Pulls in multiprocessing, which the labeler only needs once it indexes
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, wait
+
+    files = [job for job in jobs if isinstance(job[0], Path)]
+    if files:
+        workers = workers or os.cpu_count() or 1
+        # Small chunks, so a stop waits for little work already running
+        chunksize = max(1, min(16, len(files) // (workers * 4)))
+        chunks = deque(files[start:start + chunksize] for start in range(0, len(files), chunksize))
+        # Spawned workers are safe to start from a GUI process with running threads
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            running = deque()
+            while chunks or running:
+                while chunks and len(running) < workers * 2 and not (stop and stop.is_set()):
+                    chunk = chunks.popleft()
+                    running.append((chunk, executor.submit(_run_chunk, function, chunk)))
+                if not running:
+                    break
+                chunk, future = running.popleft()
+                while stop is not None and not stop.is_set() and not future.done():
+                    wait([future], timeout=0.2)
+                if stop and stop.is_set():
+                    break
+                yield from zip(chunk, future.result())
+        finally:
+            executor.shutdown(wait=not (stop and stop.is_set()), cancel_futures=True)
+    for job in jobs:
+        if stop and stop.is_set():
+            return
+        if not isinstance(job[0], Path):
+            yield job, function(*job)
@@ -0,0 +1,206 @@
+import bisect
+import codecs
+import json
+import sys
+import zlib
+from array import array
+
+# orjson is optional; it parses whole documents several times faster than json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(raw):
+    """
+    Parses a whole JSON document from bytes or str with the fastest available backend.
+
+    Both backends raise a subclass of json.JSONDecodeError on malformed input.
+    """
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _intern_keys(pairs):
+    # Every message repeats the same keys and senders; share one copy of each
+    obj = {sys.intern(key): value for key, value in pairs}
+    if isinstance(obj.get('sender'), str):
+        obj['sender'] = sys.intern(obj['sender'])
+    return obj
+
+
+class StreamingConversationParser:
+    """
+    Incremental parser for conversation files too large to load in one go.
+
+    The file is read in chunks and the messages of the top-level
+    "conversation_data" array are yielded one by one by messages(), so the
+    first messages are available long before the file has been read and the
+    raw document is never held in memory as a whole. The remaining top-level
+    fields end up in header once messages() is exhausted.
+    """
+
+    WHITESPACE = ' \t\n\r'
+
+    def __init__(self, fileobj, chunk_size=256 * 1024):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder(object_pairs_hook=_intern_keys)
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.header = {}
+        # Where the value last decoded by _value() starts in the buffer
+        self.value_start = 0
+
+    def _read(self, size):
+        """
+        Appends at least one more chunk of decoded text to the buffer.
+        """
+        # Drop what has been consumed so the buffer stays small
+        if self.pos:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        data = self.fileobj.read(max(self.chunk_size, size))
+        if not data:
+            self.eof = True
+            self.buf += self.text_decoder.decode(b'', final=True)
+        else:
+            self.buf += self.text_decoder.decode(data)
+
+    def _error(self, message):
+        return json.JSONDecodeError(message, self.buf, self.pos)
+
+    def _token(self):
+        """
+        Returns the next non-whitespace character without consuming it ('' at the end).
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in self.WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos + 1]
+            self._read(0)
+
+    def _expect(self, chars):
+        char = self._token()
+        if not char or char not in chars:
+            raise self._error(f"Expecting one of {chars!r}")
+        self.pos += 1
+        return char
+
+    def _value(self):
+        """
+        Decodes the JSON value at the current position, reading more input as needed.
+        """
+        self._token()
+        while True:
+            try:
+                self.value_start = self.pos
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number at the very end of the buffer may continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Grow reads geometrically so a huge value is not re-scanned too often
+            self._read(len(self.buf) - self.pos)
+
+    def messages(self, raw=False):
+        """
+        Yields the messages of the conversation_data array in order.
+
+        With raw set, yields (message, raw) pairs, where raw is the message's
+        JSON text as UTF-8 bytes, for RawMessages.pack().
+        """
+        self._expect('{')
+        if self._token() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self._value()
+            if not isinstance(key, str):
+                raise self._error("Expecting property name")
+            self._expect(':')
+            if key == 'conversation_data' and self._token() == '[':
+                self.pos += 1
+                if self._token() == ']':
+                    self.pos += 1
+                else:
+                    while True:
+                        value = self._value()
+                        yield (value, self.buf[self.value_start:self.pos].encode('utf-8')) if raw else value
+                        if self._expect(',]') == ']':
+                            break
+            else:
+                self.header[key] = self._value()
+            if self._expect(',}') == '}':
+                return
+
+
+class RawMessages:
+    """
+    Message list of a streamed conversation, kept as compressed raw JSON.
+
+    Messages arrive in blocks packed by pack() on the parsing thread: the
+    raw JSON of a batch of messages, zlib-compressed, with the end offset of
+    every message. That takes a fraction of the memory of the parsed dicts
+    or of the file itself. Messages are decoded when they are accessed, one
+    block at a time, so the view only decodes the chunk it renders.
+    """
+
+    def __init__(self):
+        self.blocks = []
+        # Index of the first message of each block
+        self.starts = []
+        self.count = 0
+        # (block number, decompressed block) of the last access
+        self.cached = (None, b'')
+
+    @staticmethod
+    def pack(raw):
+        """
+        Packs a list of raw messages (JSON bytes) into a block for extend().
+        """
+        ends = array('I')
+        end = 0
+        for message in raw:
+            end += len(message)
+            ends.append(end)
+        return zlib.compress(b''.join(raw), 1), ends
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[idx] for idx in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("message index out of range")
+        number = bisect.bisect_right(self.starts, index) - 1
+        if self.cached[0] != number:
+            self.cached = (number, zlib.decompress(self.blocks[number][0]))
+        ends = self.blocks[number][1]
+        position = index - self.starts[number]
+        return loads(self.cached[1][ends[position - 1] if position else 0:ends[position]])
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def extend(self, block):
+        """
+        Appends a block made by pack().
+        """
+        if not block[1]:
+            return
+        self.blocks.append(block)
+        self.starts.append(self.count)
+        self.count += len(block[1])
@@ -0,0 +1,139 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import metrics
+from parsing import loads
+
+
+def read_conversation(path):
+    """
+    Reads and parses one conversation file (or any entry with read_bytes()).
+
+    Returns:
+        tuple: The parsed conversation and its size in bytes on disk.
+    """
+    raw = path.read_bytes()
+    with metrics.timed('json_parse'):
+        data = loads(raw)
+    return data, len(raw)
+
+
+class ConversationCache:
+    """
+    Bounded LRU cache of parsed conversations.
+
+    The cache holds at most max_entries conversations whose combined file size
+    stays under max_bytes; the least recently used entries are evicted first.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def put(self, key, value, size):
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            # Items bigger than the whole budget are served once and never cached
+            if size > self.max_bytes:
+                return
+            self.entries[key] = (value, size)
+            self.total_bytes += size
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def discard(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+
+
+class Prefetcher:
+    """
+    Parses upcoming conversation files on a small worker pool so that moving to
+    the next conversation is served from the cache instead of the disk.
+
+    Files larger than max_file_bytes are not parsed here; get() returns None for
+    them so the caller can stream them instead.
+    """
+
+    def __init__(self, depth=8, workers=2, max_entries=64, max_bytes=256 * 1024 * 1024,
+                 max_file_bytes=None, loader=read_conversation):
+        self.depth = depth
+        self.max_file_bytes = max_file_bytes
+        self.loader = loader
+        self.cache = ConversationCache(max_entries=max(max_entries, depth + 1), max_bytes=max_bytes)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self.pending = {}
+        # Re-entrant: a future that is already done runs its callback immediately
+        self.lock = threading.RLock()
+
+    def _load(self, path):
+        if self.max_file_bytes is not None and path.stat().st_size > self.max_file_bytes:
+            return None
+        data, size = self.loader(path)
+        self.cache.put(path, data, size)
+        return data
+
+    def _submit(self, path):
+        """
+        Schedules a file for parsing unless it is cached or already in flight.
+        """
+        with self.lock:
+            future = self.pending.get(path)
+            if future is None:
+                future = self.executor.submit(self._load, path)
+                self.pending[path] = future
+                future.add_done_callback(lambda f, path=path: self._forget(path, f))
+            return future
+
+    def _forget(self, path, future):
+        with self.lock:
+            if self.pending.get(path) is future:
+                del self.pending[path]
+
+    def get(self, path):
+        """
+        Returns the parsed conversation for path, waiting for it if needed.
+
+        Files that fail to parse raise the original exception (for example
+        json.JSONDecodeError) and are not cached. Returns None for files above
+        max_file_bytes.
+        """
+        data = self.cache.get(path)
+        if data is not None:
+            return data
+        return self._submit(path).result()
+
+    def invalidate(self, path):
+        """
+        Drops a cached conversation whose file changed on disk.
+        """
+        self.cache.discard(path)
+
+    def prefetch_ahead(self, files, index):
+        """
+        Schedules the next depth files after index for background parsing.
+        """
+        for path in files[index + 1:index + 1 + self.depth]:
+            if path not in self.cache:
+                self._submit(path)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
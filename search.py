@@ -0,0 +1,139 @@
+import re
+import sqlite3
+
+from parallel import entry_stat
+
+_TOKEN = re.compile(r"\w+")
+
+SEARCH_SCHEMA = [
+    # One row per message; its rowid falls in the range of its conversation in search_files
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_messages USING fts5(sender, message, tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TABLE IF NOT EXISTS search_files ("
+    "conversation_id TEXT PRIMARY KEY, file_size INTEGER, file_mtime INTEGER, first_rowid INTEGER, last_rowid INTEGER)",
+    "CREATE INDEX IF NOT EXISTS search_files_rowid ON search_files (first_rowid)",
+]
+
+
+def message_rows(data):
+    """
+    Returns the (sender, message) text of every message of a parsed conversation.
+    """
+    messages = (data or {}).get('conversation_data') or []
+    return [(str(msg.get('sender') or ''), str(msg.get('message') or '')) for msg in messages]
+
+
+def match_expression(query):
+    """
+    Turns free text into an FTS5 query: every word must occur, as a word or word prefix.
+    """
+    return " ".join(f'"{token}"*' for token in _TOKEN.findall(query))
+
+
+class SearchIndex:
+    """
+    Full-text index over the message text and sender names of the corpus.
+
+    Backed by an SQLite FTS5 table in the label database. Each conversation's
+    messages occupy a contiguous rowid range, so a changed file is replaced by
+    deleting one range, and a hit maps back to its conversation and message
+    position with one index lookup. Messages are added by
+    indexing.build_indexes(). A SearchIndex uses one connection and must stay
+    on the thread that created it.
+    """
+
+    def __init__(self, db_file, journal_mode="WAL"):
+        self.conn = sqlite3.connect(str(db_file), timeout=30)
+        self.conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        for statement in SEARCH_SCHEMA:
+            self.conn.execute(statement)
+        self.conn.commit()
+
+    def stale(self, entries, stats=None, prune=True):
+        """
+        Returns (entry, (size, mtime)) for the entries that are new or changed since they were indexed.
+
+        Args:
+            entries (list): Queue entries (paths or path-like entries).
+            stats (dict): Optional name -> (size, mtime_ns) to avoid statting every file.
+            prune (bool): Drop indexed conversations missing from entries; pass
+                False when entries is only a part of the corpus.
+        """
+        known = {
+            conversation_id: (size, mtime)
+            for conversation_id, size, mtime in self.conn.execute("SELECT conversation_id, file_size, file_mtime FROM search_files")
+        }
+        stale = []
+        for entry in entries:
+            stat = entry_stat(entry, stats)
+            if known.pop(entry.stem, None) != stat:
+                stale.append((entry, stat))
+        if known and prune:
+            # Whatever is left was not among the entries any more
+            with self.conn:
+                for conversation_id in known:
+                    self.remove(conversation_id)
+        return stale
+
+    def remove(self, conversation_id):
+        """
+        Deletes the messages of one conversation; call inside a transaction.
+        """
+        row = self.conn.execute(
+            "SELECT first_rowid, last_rowid FROM search_files WHERE conversation_id = ?", (conversation_id,)
+        ).fetchone()
+        if row is not None and row[0] is not None:
+            self.conn.execute("DELETE FROM search_messages WHERE rowid BETWEEN ? AND ?", row)
+        self.conn.execute("DELETE FROM search_files WHERE conversation_id = ?", (conversation_id,))
+
+    def add(self, batch):
+        """
+        Replaces the messages of a batch of (conversation_id, (size, mtime), messages) in one transaction.
+        """
+        with self.conn:
+            next_rowid = self.conn.execute("SELECT COALESCE(MAX(rowid), 0) + 1 FROM search_messages").fetchone()[0]
+            for conversation_id, (size, mtime), messages in batch:
+                self.remove(conversation_id)
+                self.conn.executemany(
+                    "INSERT INTO search_messages (rowid, sender, message) VALUES (?, ?, ?)",
+                    ((next_rowid + position, sender, message) for position, (sender, message) in enumerate(messages)),
+                )
+                first_rowid, last_rowid = (next_rowid, next_rowid + len(messages) - 1) if messages else (None, None)
+                self.conn.execute(
+                    "INSERT INTO search_files (conversation_id, file_size, file_mtime, first_rowid, last_rowid) VALUES (?, ?, ?, ?, ?)",
+                    (conversation_id, size, mtime, first_rowid, last_rowid),
+                )
+                next_rowid += len(messages)
+
+    def search(self, query, limit=20):
+        """
+        Returns the best-ranked matching message of up to limit conversations.
+
+        Returns:
+            list[tuple]: (conversation_id, message position, sender, snippet), best first.
+        """
+        expression = match_expression(query)
+        if not expression:
+            return []
+        rows = self.conn.execute(
+            "SELECT rowid, sender, snippet(search_messages, 1, '»', '«', '…', 12) FROM search_messages "
+            "WHERE search_messages MATCH ? ORDER BY rank LIMIT ?",
+            (expression, limit * 5),
+        ).fetchall()
+        hits = []
+        seen = set()
+        for rowid, sender, snippet in rows:
+            owner = self.conn.execute(
+                "SELECT conversation_id, first_rowid FROM search_files WHERE first_rowid <= ? "
+                "ORDER BY first_rowid DESC LIMIT 1",
+                (rowid,),
+            ).fetchone()
+            if owner is None or owner[0] in seen:
+                continue
+            seen.add(owner[0])
+            hits.append((owner[0], rowid - owner[1], sender, snippet))
+            if len(hits) >= limit:
+                break
+        return hits
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,154 @@
+import io
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections import namedtuple
+from pathlib import Path
+
+# Sharded corpora hold one conversation per line
+SHARD_SUFFIXES = ('.jsonl', '.ndjson')
+
+# Sidecar index: magic, shard size and mtime, then (start, end) byte offsets per line
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"MLIDX1" + (b"L" if sys.byteorder == 'little' else b"B") + b"\0"
+INDEX_HEADER = struct.Struct('<QQ')
+
+# Minimal stat result for entries that are not files of their own
+EntryStat = namedtuple('EntryStat', ['st_size', 'st_mtime_ns'])
+
+
+def is_shard(path):
+    return Path(path).suffix.lower() in SHARD_SUFFIXES
+
+
+class NdjsonShard:
+    """
+    A JSONL/NDJSON file with one conversation per line, opened for random access.
+
+    Line offsets are computed once and saved next to the shard as
+    "<shard>.idx"; the shard itself is memory-mapped so loading conversation N
+    is a single slice of the mapping. Blank lines are skipped, so conversations
+    are numbered by record, not by physical line.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.index_file = self.path.with_name(self.path.name + INDEX_SUFFIX)
+        self.file = open(self.path, 'rb')
+        stat = os.fstat(self.file.fileno())
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        # mmap cannot map an empty file
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        self.offsets = self.load_index()
+        if self.offsets is None:
+            self.offsets = self.build_index()
+            self.save_index()
+
+    def load_index(self):
+        """
+        Returns the stored offsets, or None if the index is missing or stale.
+        """
+        try:
+            with open(self.index_file, 'rb') as f:
+                if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                    return None
+                size, mtime_ns = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+                if size != self.size or mtime_ns != self.mtime_ns:
+                    return None
+                offsets = array('Q')
+                offsets.frombytes(f.read())
+                return offsets
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def build_index(self):
+        """
+        Scans the shard once for the byte range of every non-empty line.
+        """
+        offsets = array('Q')
+        start = 0
+        while start < self.size:
+            end = self.mm.find(b'\n', start)
+            if end == -1:
+                end = self.size
+            # Only short lines can be blank; avoid copying long ones
+            if end - start > 64 or self.mm[start:end].strip():
+                offsets.append(start)
+                offsets.append(end)
+            start = end + 1
+        return offsets
+
+    def save_index(self):
+        tmp_file = self.index_file.with_name(self.index_file.name + ".tmp")
+        try:
+            with open(tmp_file, 'wb') as f:
+                f.write(INDEX_MAGIC)
+                f.write(INDEX_HEADER.pack(self.size, self.mtime_ns))
+                f.write(self.offsets.tobytes())
+            os.replace(tmp_file, self.index_file)
+        except OSError as e:
+            # Read-only location: the index is rebuilt on the next start
+            print(f"Could not write shard index: {str(e)}")
+
+    def __len__(self):
+        return len(self.offsets) // 2
+
+    def read_bytes(self, line):
+        return self.mm[self.offsets[2 * line]:self.offsets[2 * line + 1]]
+
+    def entries(self):
+        return [ShardEntry(self, line) for line in range(len(self))]
+
+    def close(self):
+        if self.size:
+            self.mm.close()
+        self.file.close()
+
+
+class ShardEntry:
+    """
+    Path-like handle to one conversation of a shard.
+
+    Provides the parts of the pathlib.Path interface the labeler uses (name,
+    stem, read_bytes, open, stat). The conversation_id (stem) is the shard name
+    followed by the 1-based record number, e.g. "export_000042" for the 42nd
+    conversation. Blank lines are not counted, so in a shard with blank lines
+    this differs from the physical line number; it also means adding or removing
+    blank lines does not change the ids of the conversations after them.
+    """
+
+    __slots__ = ('shard', 'line')
+
+    def __init__(self, shard, line):
+        self.shard = shard
+        self.line = line
+
+    @property
+    def stem(self):
+        return f"{self.shard.path.stem}_{self.line + 1:06d}"
+
+    @property
+    def name(self):
+        return f"{self.shard.path.name}:{self.line + 1}"
+
+    def read_bytes(self):
+        return self.shard.read_bytes(self.line)
+
+    def open(self, mode='rb'):
+        return io.BytesIO(self.read_bytes())
+
+    def stat(self):
+        start, end = self.shard.offsets[2 * self.line], self.shard.offsets[2 * self.line + 1]
+        return EntryStat(end - start, self.shard.mtime_ns)
+
+    def __eq__(self, other):
+        return isinstance(other, ShardEntry) and other.shard is self.shard and other.line == self.line
+
+    def __hash__(self):
+        return hash((id(self.shard), self.line))
+
+    def __repr__(self):
+        return f"ShardEntry({str(self.shard.path)!r}, {self.line})"
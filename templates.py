@@ -0,0 +1,128 @@
+import hashlib
+import re
+import sqlite3
+
+# MinHash signature of NUM_BANDS bands with ROWS_PER_BAND values each; two replies
+# with Jaccard similarity s share at least one band with probability 1 - (1 - s^4)^8
+NUM_BANDS = 8
+ROWS_PER_BAND = 4
+SHINGLE_WORDS = 3
+# Shorter replies ("Thanks!", "ok") repeat across the corpus without being templates
+MIN_WORDS = 5
+
+_SALTS = [
+    int.from_bytes(hashlib.blake2b(str(idx).encode(), digest_size=8).digest(), 'little')
+    for idx in range(NUM_BANDS * ROWS_PER_BAND)
+]
+_WORD = re.compile(r"[a-z']+|\d+")
+
+TEMPLATE_SCHEMA = [
+    # Number of conversations with at least one reply in each LSH bucket
+    "CREATE TABLE IF NOT EXISTS template_bands (band_key INTEGER PRIMARY KEY, conversations INTEGER NOT NULL)",
+    # Conversations already counted, so later runs only add new ones
+    "CREATE TABLE IF NOT EXISTS template_conversations (conversation_id TEXT PRIMARY KEY)",
+]
+
+
+def band_keys(text):
+    """
+    Returns the LSH bucket keys of one message, or an empty list if it is too short.
+
+    Text is lowercased and digits are collapsed, so replies that differ only in
+    names, dates or order numbers still share most of their shingles.
+    """
+    words = ['0' if word.isdigit() else word for word in _WORD.findall((text or '').lower())]
+    if len(words) < MIN_WORDS:
+        return []
+    hashes = {
+        int.from_bytes(hashlib.blake2b(" ".join(words[idx:idx + SHINGLE_WORDS]).encode(), digest_size=8).digest(), 'little')
+        for idx in range(len(words) - SHINGLE_WORDS + 1)
+    }
+    signature = [min(value ^ salt for value in hashes) for salt in _SALTS]
+    keys = []
+    for band in range(NUM_BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(repr((band, rows)).encode(), digest_size=8).digest()
+        # SQLite integers are signed 64-bit
+        keys.append(int.from_bytes(digest, 'little', signed=True))
+    return keys
+
+
+def responder_messages(data):
+    """
+    Returns the messages not sent by the lead (the sender of the first message).
+    """
+    messages = (data or {}).get('conversation_data') or []
+    lead = messages[0].get('sender') if messages else None
+    return [msg for msg in messages if msg.get('sender') != lead]
+
+
+def reply_band_keys(data):
+    """
+    Returns the distinct bucket keys of a parsed conversation's replies.
+    """
+    keys = set()
+    for msg in responder_messages(data):
+        keys.update(band_keys(msg.get('message')))
+    return keys
+
+
+class TemplateIndex:
+    """
+    Corpus-wide index of templated replies, kept in the label database.
+
+    Every responder message is reduced to NUM_BANDS locality-sensitive bucket
+    keys. Only a count of conversations per bucket is stored, on disk, so
+    memory use is bounded by one batch while building, repeated replies share
+    their rows, and a lookup is a few primary-key reads. A reply is considered
+    templated when one of its buckets occurs in min_conversations or more
+    conversations. The counts are filled in by indexing.build_indexes(). A
+    TemplateIndex uses one connection and must stay on the thread that created it.
+    """
+
+    def __init__(self, db_file, min_conversations=5, journal_mode="WAL"):
+        self.min_conversations = min_conversations
+        self.conn = sqlite3.connect(str(db_file), timeout=30)
+        self.conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        for statement in TEMPLATE_SCHEMA:
+            self.conn.execute(statement)
+        self.conn.commit()
+
+    def new_entries(self, entries):
+        """
+        Returns the entries whose conversations are not counted yet.
+        """
+        known = {conversation_id for (conversation_id,) in self.conn.execute("SELECT conversation_id FROM template_conversations")}
+        return [entry for entry in entries if entry.stem not in known]
+
+    def merge(self, counts, conversation_ids):
+        """
+        Adds bucket counts and marks their conversations as indexed in one transaction.
+        """
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO template_bands (band_key, conversations) VALUES (?, ?) "
+                "ON CONFLICT (band_key) DO UPDATE SET conversations = conversations + excluded.conversations",
+                counts.items(),
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO template_conversations (conversation_id) VALUES (?)",
+                ((conversation_id,) for conversation_id in conversation_ids),
+            )
+        return len(conversation_ids)
+
+    def is_templated(self, text):
+        """
+        Returns True if the message matches a reply seen in min_conversations or more conversations.
+        """
+        keys = band_keys(text)
+        if not keys:
+            return False
+        row = self.conn.execute(
+            f"SELECT MAX(conversations) FROM template_bands WHERE band_key IN ({', '.join('?' for _ in keys)})",
+            keys,
+        ).fetchone()
+        return (row[0] or 0) >= self.min_conversations
+
+    def close(self):
+        self.conn.close()
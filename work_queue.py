@@ -0,0 +1,141 @@
+import os
+import socket
+import sqlite3
+import time
+
+# Shared with LabelStore, which marks items done in the same transaction as their labels
+WORK_ITEMS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS work_items (
+        conversation_id TEXT PRIMARY KEY,
+        position INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'open',
+        owner TEXT,
+        lease_expires REAL,
+        skipped_by TEXT
+    )
+"""
+
+
+def default_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    Queue of conversations shared by several annotators through one SQLite file.
+
+    Each labeler leases small batches of open conversation_ids. A lease expires
+    after lease_seconds unless it is renewed by heartbeat(), so the items of a
+    crashed instance return to the pool on their own. Items are marked done by
+    the label store when their labels are committed, and released on skip or
+    exit. A WorkQueue uses one connection and must stay on the thread that
+    created it.
+    """
+
+    def __init__(self, db_file, owner=None, lease_size=20, lease_seconds=300):
+        self.owner = owner or default_owner()
+        self.lease_size = lease_size
+        self.lease_seconds = lease_seconds
+        # Autocommit mode; write transactions are opened explicitly with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(str(db_file), timeout=30, isolation_level=None)
+        # Network shares do not support WAL's shared memory, so use a rollback journal
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.execute(WORK_ITEMS_SCHEMA)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS work_items_open ON work_items (status, position)")
+
+    def _write(self, statements):
+        """
+        Runs (sql, params) pairs in one immediate transaction and returns the last cursor.
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = None
+            for sql, params in statements:
+                cursor = self.conn.execute(sql, params)
+            self.conn.execute("COMMIT")
+            return cursor
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def register(self, conversation_ids):
+        """
+        Adds conversations to the queue; ones already known keep their state.
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            start = self.conn.execute("SELECT COALESCE(MAX(position), 0) FROM work_items").fetchone()[0]
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO work_items (conversation_id, position) VALUES (?, ?)",
+                ((conversation_id, start + idx) for idx, conversation_id in enumerate(conversation_ids, start=1)),
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def lease(self):
+        """
+        Claims the next batch of open conversations for this owner.
+
+        Returns the claimed conversation_ids in queue order. Conversations this
+        owner already holds are not returned again; owners are per process, so a
+        restarted labeler gets a crashed session's items back once they expire.
+        """
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.conn.execute(
+                "SELECT conversation_id FROM work_items "
+                "WHERE status = 'open' AND (skipped_by IS NULL OR skipped_by != ?) "
+                "AND (owner IS NULL OR lease_expires < ?) "
+                "ORDER BY position LIMIT ?",
+                (self.owner, now, self.lease_size),
+            ).fetchall()
+            conversation_ids = [conversation_id for (conversation_id,) in rows]
+            self.conn.executemany(
+                "UPDATE work_items SET owner = ?, lease_expires = ? WHERE conversation_id = ?",
+                ((self.owner, now + self.lease_seconds, conversation_id) for conversation_id in conversation_ids),
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return conversation_ids
+
+    def heartbeat(self):
+        """
+        Extends every open lease held by this owner.
+        """
+        self._write([(
+            "UPDATE work_items SET lease_expires = ? WHERE owner = ? AND status = 'open'",
+            (time.time() + self.lease_seconds, self.owner),
+        )])
+
+    def release(self, conversation_ids=None, skipped=False):
+        """
+        Gives leased conversations back to the pool (all of this owner's if None).
+
+        Skipped conversations are not leased to this owner again.
+        """
+        if conversation_ids is None:
+            self._write([(
+                "UPDATE work_items SET owner = NULL, lease_expires = NULL WHERE owner = ? AND status = 'open'",
+                (self.owner,),
+            )])
+            return
+        self._write([(
+            "UPDATE work_items SET owner = NULL, lease_expires = NULL, "
+            "skipped_by = CASE WHEN ? THEN ? ELSE skipped_by END "
+            "WHERE conversation_id = ? AND owner = ? AND status = 'open'",
+            (skipped, self.owner, conversation_id, self.owner),
+        ) for conversation_id in conversation_ids])
+
+    def counts(self):
+        """
+        Returns the number of conversations per status.
+        """
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM work_items GROUP BY status"))
+
+    def close(self):
+        self.conn.close()